@@ -1,11 +1,13 @@
 from cadquery import *
-from math import atan, radians, degrees
+from math import atan, atan2, radians, degrees, sin
 
 from dataclasses import dataclass
 import sys
 sys.path.append("../cq_style")
 from cq_style import StylishPart
 from tube_adaptor import TubeAdaptor
+from perforation import grid_points, hex_points, cylinder_locations, lofted_locations, hole, perforate
+import quality
 
 @dataclass
 class PyramidAirstone(StylishPart):
@@ -13,55 +15,74 @@ class PyramidAirstone(StylishPart):
     base_w: float = 35
     stone_h: float = 25
     airhole_r: float = 0.25
+    hole_pattern: str = "grid" #Layout of airholes on each side ("grid" or "hex")
+    n_rows: int = 4 #Rows of airholes on each side
+    n_cols: int = 3 #Columns of airholes on each side
+    hole_spacing: float = 4 #Distance between airhole columns
 
     def calc_vars(self):
         self.wall_thick = self.adaptor.wall_thick
         self.wall_angle = degrees(atan(self.stone_h/(self.base_w/2)))
         self.adaptor_r = self.adaptor.adaptor_or
+        self.mesh_tolerance = self.airhole_r / 15 #Keeps the air holes round in STL exports (see meshing.py)
+
+    def hollow(self):
+        #OCCT can't shell a square to circle loft, so the cavity is a smaller loft cut from the inside
+        #Each side is inset so the wall stays wall_thick thick normal to the slope
+        t = self.wall_thick
+        run = self.base_w/2 - self.adaptor_r
+        inset = t / sin(atan2(self.stone_h, run))
+        bottom_w = 2*(self.base_w/2 - t*run/self.stone_h - inset)
+        top_r = self.adaptor_r + t*run/self.stone_h - inset
+        outer = Workplane("XY").rect(self.base_w, self.base_w).workplane(self.stone_h).circle(self.adaptor_r).loft()
+        inner = (
+            Workplane("XY").workplane(t).rect(bottom_w, bottom_w)
+            .workplane(self.stone_h - 2*t).circle(top_r)
+            .loft()
+        )
+        return outer.cut(inner)
 
     def make(self):
         part = (
-            Workplane("XY").rect(self.base_w, self.base_w)
-            .workplane(self.stone_h).circle(self.adaptor_r)
-            .loft()
-            .shell(-self.wall_thick)
+            self.hollow()
             .faces(">Z")
             .circle(self.adaptor.adaptor_ir)
             .cutBlind("next")
         )
-        base_hole = (
-            Workplane("XY").cylinder(self.base_w, self.airhole_r, centered=[1,1,0])
-            .translate((0,0,self.wall_thick))
-            .rotate((0,0,0), (0,1,0), self.wall_angle)
+        if quality.preview():
+            #Air holes don't change fit or layout
+            return part.union(self.adaptor.part().translate((0,0,self.stone_h)))
+        height_per_row = self.stone_h / self.n_rows
+        points = (hex_points if self.hole_pattern == "hex" else grid_points)(
+            self.n_cols, self.n_rows, self.hole_spacing, height_per_row,
+            origin=(0, -height_per_row), centered=(True, False)
+        )
+        #Holes must not break through the base of the stone
+        base = Workplane("XY").box(self.base_w,self.base_w, self.wall_thick, centered=[1,1,0])
+        #Holes are centered on the outer face and only span the wall
+        face = self.base_w/2 * sin(radians(self.wall_angle))
+        part = perforate(
+            part, hole(self.airhole_r, 2*(self.wall_thick+1), centered=True),
+            lofted_locations(points, self.wall_angle, face=face), keep_out=base
         )
-        n_sides = 4
-        n_rows = 4
-        n_cols = 3
-        height_per_row = self.stone_h / n_rows
-        for i in range(n_sides):
-            for j in range(n_rows):
-                for k in range(n_cols):
-                    hole = (
-                        base_hole
-                        .translate((0, (k-1)*4, height_per_row * (j-1)))
-                        .rotate((0,0,0), (0,0,1), i*360/n_sides)
-                        .cut(Workplane("XY").box(self.base_w,self.base_w, self.wall_thick, centered=[1,1,0]))
-                    )
-                    #debug(hole)
-                    part = part.cut(hole)
 
         part = part.union(self.adaptor.part().translate((0,0,self.stone_h)))
         return part
 
+@dataclass
 class CylinderAirstone(StylishPart):
     adaptor = TubeAdaptor(adaptor_or=4.5/2, adaptor_h=10, flip_part=1, wall_thick=1)
     stone_r: float = 6
     stone_h: float = 50
     airhole_r: float = 0.15
+    hole_pattern: str = "grid" #Layout of airholes around the wall ("grid" or "hex")
+    n_cols: int = 6 #Airholes around each row
+    row_spacing: float = 5 #Height of wall per row of airholes
 
     def calc_vars(self):
         self.wall_thick = self.adaptor.wall_thick
         self.adaptor_r = self.adaptor.adaptor_or
+        self.mesh_tolerance = self.airhole_r / 15 #Keeps the air holes round in STL exports (see meshing.py)
 
     def make(self):
         loft_h = 4
@@ -76,22 +97,21 @@ class CylinderAirstone(StylishPart):
             .circle(self.adaptor.adaptor_ir)
             .cutBlind("next")
         )
+        if quality.preview():
+            return part.union(self.adaptor.part().translate((0,0,self.stone_h+loft_h)))
         
-        n_rows = round(self.stone_h / 5)
-        n_cols = 6
+        n_rows = round(self.stone_h / self.row_spacing)
         row_h = self.stone_h * 0.8 / n_rows
-        rot_angle = 360 / n_cols
-        
-        for i in range(n_rows):
-            for j in range(n_cols):
-                hole = (
-                    Workplane("YZ")
-                    .circle(self.airhole_r).extrude(self.stone_r)      
-                    .translate((0,0,self.stone_h/2 + ((i-n_rows/2+0.5)*row_h)))      
-                    .rotate((0,0,0), (0,0,1), j * rot_angle )
-                )
-                #debug(hole)
-                part = part.cut(hole)
+        #Points are (angle, z) on the cylinder wall
+        points = (hex_points if self.hole_pattern == "hex" else grid_points)(
+            self.n_cols, n_rows, 360 / self.n_cols, row_h,
+            origin=(0, self.stone_h/2), centered=(False, True)
+        )
+        #Holes are centered on the outer wall and only span it
+        part = perforate(
+            part, hole(self.airhole_r, 2*(self.wall_thick+1), centered=True),
+            cylinder_locations(points, radius=self.stone_r)
+        )
 
         part = part.union(self.adaptor.part().translate((0,0,self.stone_h+loft_h)))
         return part
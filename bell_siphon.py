@@ -1,8 +1,15 @@
 from cadquery import *
 from dataclasses import dataclass
 import math
+import numpy as np
 
 from netcup import Netcup
+from hydraulics import ML, mesh_triangles, volume_below, orifice_flow
+from part_cache import cache_key, cached_make
+from booleans import fuse_all
+from patterns import circular_pattern
+import primitives
+import quality
 from typing import Union
 from enum import Enum
 
@@ -52,19 +59,25 @@ class BellSiphon(StylishPart):
         self.bell_r = self.siphon_r * 2 #Radius of bell (2:1 ratio is important for bell siphon function, probably should not change this; read more here: https://www.ctahr.hawaii.edu/oc/freepubs/pdf/bio-10.pdf)
         self.bell_h = self.siphon_h - math.sqrt(self.bell_r**2 - self.siphon_funnel_top_r**2) #Dist between bell and top of siphon based on radius of each to prevent overlap during assembly
         self.siphon_offset: float = self.basin_r - self.bell_r - self.wall_thick
+        self.snorkel_opening_h: float = 2 #Water level at which snorkel bottom opens up = height/water level to stop siphoning
+        self.snorkel_r: float = 3.5 #snorkel pipe radius
+        self.snorkel_h: float = self.bell_slot_h + self.snorkel_opening_h #Z-height at which snorkel opens to stop siphoning; derived from snorkel_opening_h
+        self.snorkel_offset: float = self.bell_r + self.wall_thick + self.snorkel_r - 0.5 #X/Y offset of snorkel from bell wall
+        self.cutout_z_offset: float = self.wall_thick + 12 #Z-height of the wall cutouts that let water in from the tower
+        self.cutout_h: float = 16
+        self.cutout_angle_range: float = 100 #Spread of the cutouts around the side of the basin facing up into the tower
+        self.cutout_slot_n: int = 5
+        self.cutout_r: float = self.wall_thick*2
 
 
     def lock_nubs(self, floor):
-        nub = Workplane("XZ").circle(self.lock_nub_diam/2).extrude(self.lock_nub_diam/2 + 1)
-        nub = nub.faces("<Y").fillet(self.lock_nub_diam/4)
+        nub = primitives.lock_nub(self.lock_nub_diam, self.lock_nub_diam/2 + 1)
         nub = nub.translate((0,-self.basin_r+1,self.basin_h-self.lock_nub_diam/2 - self.lock_top_offset))
 
         #Revolve around center
-        for i in range(self.n_locks):
-            offset_angle = i * 360 / self.n_locks 
-            floor = floor.union(nub.rotate((0,0,0), (0,0,1), offset_angle))
-        return floor
+        return fuse_all(floor, [circular_pattern(nub, self.n_locks)])
 
+    @cached_make
     def make(self):
         #Create basin
         if self.round_basin:
@@ -78,8 +91,9 @@ class BellSiphon(StylishPart):
             basin = (
                 Workplane("XY").box(2*self.basin_r, 2*self.basin_r,self.basin_h, centered=[1,1,0])
                 .faces(">Z").shell(-self.wall_thick, kind="intersection")
-                .edges("|Z").fillet(self.wall_thick)
             )
+            if not quality.preview():
+                basin = basin.edges("|Z").fillet(self.wall_thick)
 
         #Create siphon (+basin)
         siphon = (
@@ -134,11 +148,10 @@ class BellSiphon(StylishPart):
             basin = self.lock_nubs(basin)
 
         if self.snorkel:
-            snorkel_opening_h = 2 #Water level at which snorkel bottom opens up = height/water level to stop siphoning
-            snorkel_r = 3.5 #snorkel pipe radius
+            snorkel_r = self.snorkel_r
             snorkel_wall_thick = 1.5 #snorkel pipe wall thicness
-            snorkel_h = self.bell_slot_h + snorkel_opening_h #Z-height at which snorkel opens to stop siphoning; derived from snorkel_opening_h
-            snorkel_offset = self.bell_r + self.wall_thick + snorkel_r - 0.5 #X/Y offset of snorkel from bell wall
+            snorkel_h = self.snorkel_h
+            snorkel_offset = self.snorkel_offset
             snorkel_bell_entrance_h = self.siphon_h - self.bell_r  #Z-height at which snorkel enters bell
             snorkel_slot_h = 6
 
@@ -167,21 +180,101 @@ class BellSiphon(StylishPart):
             basin = basin.union(snorkel)
             basin = basin.cut(isnorkel)
 
-        wall_cutout = 1
-        cutout_z_offset = self.wall_thick + 12
+        wall_cutout = not quality.preview()
+        cutout_z_offset = self.cutout_z_offset
         cuthout_w = self.basin_r * 1.5
-        cutout_h = 16
-        cutout_angle_range = 100
-        cutout_slot_n = 5
+        cutout_h = self.cutout_h
+        cutout_angle_range = self.cutout_angle_range
+        cutout_slot_n = self.cutout_slot_n
         if wall_cutout:
             #basin = basin.copyWorkplane(Workplane("YZ")).workplane(0, origin=(0,0,cutout_z_offset)).rect(cuthout_w, cutout_h, centered=[1,0]).cutBlind(-self.basin_r)
-            basin = basin.copyWorkplane(Workplane("XY")).workplane(cutout_z_offset).polarArray(self.basin_r, 90 + (180-cutout_angle_range)/2, cutout_angle_range, cutout_slot_n).circle(self.wall_thick*2).cutBlind(cutout_h)
+            basin = basin.copyWorkplane(Workplane("XY")).workplane(cutout_z_offset).polarArray(self.basin_r, 90 + (180-cutout_angle_range)/2, cutout_angle_range, cutout_slot_n).circle(self.cutout_r).cutBlind(cutout_h)
 
-        if self.drain_hole:
+        if self.drain_hole and not quality.preview():
             basin = basin.faces("<Z").workplane().moveTo((self.bell_r - self.siphon_r) * 1.5 + self.siphon_offset).hole(2*self.drain_hole_r, self.wall_thick)
 
         return basin.rotate((0,0,0), (0,0,1), 180)
 
+    def installed_pose(self):
+        #Basin as seated in a PlantFloor port (as drawn by draw_water); water levels are world Z in this pose
+        return Location(Vector(0,0,0), Vector(0,1,0), self.basin_angle-90) * Location(Vector(self.basin_r,0,0))
+
+    def installed_z(self, points):
+        #World Z of (x, y, z) points given in the frame make() builds the siphon in, before its final half turn
+        pose = self.installed_pose()
+        return np.array([Vertex.makeVertex(-x, -y, z).moved(pose).Z for (x, y, z) in points])
+
+    def water_cavity(self):
+        #Space in the installed basin that holds water: the basin interior minus the part and the siphon bore
+        inner_r = self.basin_r - self.wall_thick
+        inner_h = self.basin_h - self.wall_thick
+        if self.round_basin:
+            inner = Solid.makeCylinder(inner_r, inner_h, Vector(0,0,self.wall_thick))
+        else:
+            inner = Solid.makeBox(2*inner_r, 2*inner_r, inner_h, Vector(-inner_r,-inner_r,self.wall_thick))
+        #make() finishes with a half turn, which puts the siphon at -siphon_offset
+        bore = Solid.makeCylinder(self.siphon_r-self.wall_thick, self.basin_h, Vector(-self.siphon_offset,0,0))
+        return inner.cut(self.make().val(), bore).moved(self.installed_pose())
+
+    def water_levels(self):
+        #(outlet, stop, trigger) levels: the siphon outlet, the level at which air breaks the siphon
+        #(first bell slot or snorkel opening uncovered) and the level at which it starts (lowest point of the siphon rim)
+        slant_h = math.tan(math.radians(90-self.basin_angle))*self.siphon_r*2
+        rim = [
+            (self.siphon_offset-self.siphon_r, 0, self.drain_h+self.wall_thick),
+            (self.siphon_offset+self.siphon_r, 0, self.drain_h+self.wall_thick+slant_h),
+        ]
+        if self.snorkel:
+            a = math.radians(self.snorkel_angle)
+            openings = [(self.siphon_offset-self.snorkel_offset*math.sin(a), -self.snorkel_offset*math.cos(a), self.snorkel_h)]
+        else:
+            angles = np.linspace(0, 2*math.pi, self.n_bell_slot, endpoint=False)
+            openings = [(self.siphon_offset+self.bell_r*math.cos(a), self.bell_r*math.sin(a), self.bell_slot_h) for a in angles]
+        return (self.installed_z([(self.siphon_offset, 0, 0)])[0], self.installed_z(openings).max(), self.installed_z(rim).min())
+
+    def volume_curve(self, heights):
+        #Water held (mL) at each installed water level; the siphon is built and tessellated once per design
+        #The mesh is kept with the part's cache key, so changing a field afterwards (eg. in a sweep) remeshes
+        key = cache_key(self)
+        if getattr(self, "_water_mesh", (None, None))[0] != key:
+            self._water_mesh = (key, mesh_triangles(self.water_cavity()))
+        return volume_below(self._water_mesh[1], heights) / ML
+
+    def cycle(self, inflow, outlet_drop=0, cd=0.6, n=400):
+        #Fill/drain cycle for a steady inflow (mL/s); times are in s
+        #Draining is modelled as pipe flow through the siphon bore under the head above the outlet
+        #(plus outlet_drop, the fall of the discharge below the basin)
+        (outlet_h, stop_h, trigger_h) = self.water_levels()
+        if stop_h >= trigger_h:
+            #Air reaches the bell before the water reaches the siphon rim, so it never primes
+            first_fill_s = float(np.diff(self.volume_curve([outlet_h, trigger_h]))[0]) / inflow
+            return {
+                "trigger_h": trigger_h, "stop_h": stop_h, "primes": False, "siphon_breaks": False,
+                "first_fill_s": first_fill_s, "fill_s": math.inf, "drain_s": math.inf, "period_s": math.inf,
+            }
+        bore_area = math.pi * (self.siphon_r-self.wall_thick)**2
+        levels = np.linspace(stop_h, trigger_h, n)
+        volumes = self.volume_curve(np.concatenate([[outlet_h], levels]))
+        (start_v, volumes) = (volumes[0], volumes[1:])
+        mid_levels = (levels[1:] + levels[:-1]) / 2
+        net_drain = orifice_flow(bore_area, mid_levels-outlet_h+outlet_drop, cd) / ML - inflow
+        #The siphon only breaks if it out-drains the inflow all the way down to the stop level
+        breaks = bool(np.all(net_drain > 0))
+        drain_s = float(np.sum(np.diff(volumes) / net_drain)) if breaks else math.inf
+        fill_s = (volumes[-1] - volumes[0]) / inflow
+        return {
+            "trigger_h": trigger_h,
+            "stop_h": stop_h,
+            "trigger_volume_ml": volumes[-1],
+            "cycle_volume_ml": volumes[-1] - volumes[0],
+            "first_fill_s": (volumes[-1] - start_v) / inflow,
+            "fill_s": fill_s,
+            "drain_s": drain_s,
+            "period_s": fill_s + drain_s,
+            "primes": True,
+            "siphon_breaks": breaks,
+        }
+
     def draw_water(self, water_h):
         bs = self.make()
         water_line = Workplane("XY").workplane(water_h).circle(self.basin_r*5).extrude(1)#.intersect()
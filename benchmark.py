@@ -0,0 +1,174 @@
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from build import REPO_DIR, buildable, discover, parse_params, part_params, set_booleans
+
+#Benchmarks every part generator at default and stress parameters against a stored baseline
+#  python benchmark.py --save                 (record benchmarks.json)
+#  python benchmark.py                        (compare, exit 1 on regression)
+#  python benchmark.py BellSiphon --threshold 0.1
+#  python benchmark.py PlantFloor --booleans parallel=0   (OCCT boolean settings are recorded with each result)
+
+BASELINE = os.path.join(REPO_DIR, "benchmarks.json")
+
+#Parameters that push each generator well past its defaults
+STRESS = {
+    "PlantFloor": {"n_locks": 8},
+    "MasonFloor": {"n_locks": 8},
+    "MasonThread": {"thread_h": 6.5*5, "lid_h": 6.5*5 + 2}, #Twice the thread turns
+    "CrownFloor": {"n_locks": 8},
+    "CrownSieve": {"n_hole_per_row": 24},
+    "BellSiphon": {"snorkel": True, "siphon_funnel": True, "n_bell_slot": 8, "n_siphon_slot": 8},
+    "Sprinkler": {"n_slots": 12, "n_rows": 3},
+    "PyramidAirstone": {"n_rows": 12, "n_cols": 7, "hole_spacing": 1.5, "hole_pattern": "hex"},
+    "CylinderAirstone": {"n_cols": 24, "row_spacing": 1},
+    "TubeAdaptor": {"n_barbs": 10},
+}
+METRICS = ["build_s", "booleans", "tessellate_s", "peak_rss_mb"]
+MIN_DELTA = {"build_s": 0.05, "tessellate_s": 0.05, "peak_rss_mb": 20, "booleans": 0} #Ignore noise below these
+
+def cases(names, suffix=""):
+    for name in names:
+        yield (name, "default" + suffix, {})
+        if name in STRESS:
+            yield (name, "stress" + suffix, STRESS[name])
+
+class BooleanCounter:
+    #Counts every OCCT boolean (fuse, cut, intersect, split) run while active
+    def __enter__(self):
+        import cadquery as cq
+        self.count = 0
+        self._bool_op = cq.Shape._bool_op
+        def counted(shape, *args, **kwargs):
+            self.count += 1
+            return self._bool_op(shape, *args, **kwargs)
+        cq.Shape._bool_op = counted
+        return self
+
+    def __exit__(self, *exc):
+        import cadquery as cq
+        cq.Shape._bool_op = self._bool_op
+
+def run_case(module, name, params, tolerance):
+    #Runs in a fresh worker process so ru_maxrss is the peak of this case alone
+    import boolean_options #Before the part is built, also for parts that don't import a helper module
+    import importlib
+    import cadquery as cq
+    from part_cache import to_shape
+    part = getattr(importlib.import_module(module), name)(**params)
+    with BooleanCounter() as booleans:
+        t_start = time.perf_counter()
+        result = part.part()
+        build_s = time.perf_counter() - t_start
+    shape = to_shape(result.toCompound() if isinstance(result, cq.Assembly) else result)
+    t_start = time.perf_counter()
+    (vertices, triangles) = shape.tessellate(tolerance)
+    tessellate_s = time.perf_counter() - t_start
+    return {
+        "boolean_options": boolean_options.current(),
+        "build_s": build_s,
+        "booleans": booleans.count,
+        "tessellate_s": tessellate_s,
+        "triangles": len(triangles),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def compare(row, base, threshold):
+    #Metrics that got worse than the baseline by more than threshold (relative) and MIN_DELTA (absolute)
+    regressions = []
+    for m in METRICS:
+        if m not in base or m not in row:
+            continue
+        delta = row[m] - base[m]
+        if delta > MIN_DELTA[m] and delta > threshold * base[m]:
+            regressions.append(f"{m} {base[m]:.3g} -> {row[m]:.3g}")
+    return regressions
+
+def print_report(rows):
+    options = {json.dumps(r["boolean_options"], sort_keys=True) for r in rows if "boolean_options" in r}
+    for o in sorted(options):
+        print(f"OCCT booleans: {', '.join(f'{k}={v}' for (k, v) in json.loads(o).items())}")
+    print(f"{'case':<28}{'build s':>10}{'bools':>8}{'tess s':>10}{'peak MB':>10}  status")
+    for r in rows:
+        case = f"{r['part']}[{r['variant']}]"
+        if "error" in r:
+            print(f"{case:<28}{'failed':>10}{'':>8}{'':>10}{'':>10}  {r['error']}")
+            continue
+        status = "; ".join(r["regressions"]) if r["regressions"] else ("new" if r["new"] else "ok")
+        if r["other_options"]:
+            status += " (baseline ran with other boolean settings)"
+        print(f"{case:<28}{r['build_s']:>10.2f}{r['booleans']:>8}{r['tessellate_s']:>10.2f}{r['peak_rss_mb']:>10.0f}  {status}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark cq_hydro part generators")
+    parser.add_argument("parts", nargs="*", help="Part class names to benchmark (default: all)")
+    parser.add_argument("--baseline", default=BASELINE, help="Baseline JSON file")
+    parser.add_argument("--save", action="store_true", help="Record the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown flagged as a regression")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Tessellation tolerance")
+    parser.add_argument("--set", action="append", metavar="FIELD=VALUE", help="Override a field in every case (JSON value)")
+    parser.add_argument("-q", "--quality", default="final", choices=["final", "preview"], help="Build quality (preview skips cosmetic features)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Cases run concurrently (timings are noisier above 1)")
+    parser.add_argument("--booleans", metavar="NAME=VALUE,...", help="OCCT boolean settings: parallel, fuzzy, obb (see boolean_options.py)")
+    args = parser.parse_args(argv)
+
+    #Always measure real builds, never cache hits
+    os.environ["CQ_HYDRO_NO_CACHE"] = "1"
+    os.environ["CQ_HYDRO_QUALITY"] = args.quality
+    if args.booleans is not None:
+        set_booleans(parser, args.booleans)
+
+    parts = discover()
+    unknown = [p for p in args.parts if p not in parts]
+    if unknown:
+        parser.error(f"unknown part(s): {', '.join(unknown)}")
+    unbuildable = [p for p in args.parts if not buildable(parts[p])]
+    if unbuildable:
+        parser.error(f"{', '.join(unbuildable)} can't be built from defaults")
+    names = args.parts or sorted(n for n in parts if buildable(parts[n]))
+    overrides = parse_params(args.set, parser)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=args.jobs, mp_context=get_context("spawn"), max_tasks_per_child=1) as pool:
+        futures = []
+        for (name, variant, params) in cases(names, "" if args.quality == "final" else f"-{args.quality}"):
+            params = {**params, **part_params(parts[name], overrides)}
+            futures.append((name, variant, params, pool.submit(run_case, parts[name].__module__, name, params, args.tolerance)))
+        for (name, variant, params, future) in futures:
+            row = {"part": name, "variant": variant, "params": params}
+            try:
+                row.update(future.result())
+            except Exception as e:
+                row["error"] = f"{type(e).__name__}: {e}"
+                rows.append(row)
+                continue
+            base = baseline.get(f"{name}[{variant}]")
+            row["new"] = base is None
+            row["regressions"] = [] if base is None else compare(row, base, args.threshold)
+            #Still compared, but timings against a baseline run with other boolean settings say little
+            row["other_options"] = base is not None and base.get("boolean_options", row["boolean_options"]) != row["boolean_options"]
+            rows.append(row)
+
+    print_report(rows)
+    if args.save:
+        for r in rows:
+            if "error" not in r:
+                baseline[f"{r['part']}[{r['variant']}]"] = {k: r[k] for k in ["params", "triangles", "boolean_options"] + METRICS}
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        return 1 if any("error" in r for r in rows) else 0
+    return 1 if any("error" in r or r["regressions"] for r in rows) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
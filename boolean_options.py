@@ -0,0 +1,100 @@
+import os
+from contextlib import contextmanager
+from functools import lru_cache
+
+import cadquery as cq
+
+#Project-wide OCCT boolean settings
+#Every boolean a build runs (Workplane union/cut/intersect, fuse_all/cut_all, splits) goes through
+#cq.Shape._bool_op, which is wrapped here so the settings below apply to all of them:
+#  parallel  run each boolean's intersection stage on every core (SetRunParallel)
+#  fuzzy     extra tolerance in mm for operands that almost touch or coincide (0 is exact)
+#  obb       also check oriented bounding boxes before intersecting operands (SetUseOBB)
+#Glue isn't one of them: it's only right for operands that touch without overlapping, and most of ours
+#overlap (eg. the make_base lip unions), so it's asked for per boolean with union(glue=True)
+#Kept in the environment like the quality level, so worker processes inherit it
+#  with boolean_options.options(parallel=False, obb=True):
+#      PlantFloor().part()
+#  python build.py PlantFloor --booleans fuzzy=1e-4,obb=1
+
+ENV = "CQ_HYDRO_BOOLEANS"
+DEFAULTS = {"parallel": True, "fuzzy": 0.0, "obb": False}
+GEOMETRY = ("fuzzy",) #Options that can change the resulting solid, not just how fast it is found
+
+def _flag(value):
+    if value.lower() in ("1", "true", "yes", "on"):
+        return True
+    if value.lower() in ("0", "false", "no", "off"):
+        return False
+    raise ValueError(f"expected a boolean, got {value!r}")
+
+def check(opts):
+    #Validated copy of opts over the defaults
+    if "glue" in opts:
+        raise ValueError("glue can't be set for every boolean (it breaks operands that overlap, eg. PlantFloor); pass glue=True to the union()s whose operands only touch")
+    unknown = [k for k in opts if k not in DEFAULTS]
+    if unknown:
+        raise ValueError(f"unknown boolean option(s) {', '.join(unknown)} (expected {', '.join(DEFAULTS)})")
+    opts = {**DEFAULTS, **opts}
+    opts["parallel"] = _flag(str(opts["parallel"]))
+    opts["obb"] = _flag(str(opts["obb"]))
+    opts["fuzzy"] = float(opts["fuzzy"])
+    if opts["fuzzy"] < 0:
+        raise ValueError("fuzzy tolerance can't be negative")
+    return opts
+
+@lru_cache(maxsize=16)
+def _parse(text):
+    pairs = [item.split("=", 1) for item in text.replace(" ", "").split(",") if item]
+    bad = [p[0] for p in pairs if len(p) != 2]
+    if bad:
+        raise ValueError(f"expected NAME=VALUE, got {', '.join(bad)}")
+    return tuple(check(dict(pairs)).items())
+
+def parse(text):
+    #"parallel=0,fuzzy=1e-4" -> every option, defaults filled in
+    return dict(_parse(text))
+
+def to_string(opts):
+    return ",".join(f"{k}={int(v) if isinstance(v, bool) else v}" for (k, v) in opts.items())
+
+def current():
+    return parse(os.environ.get(ENV, ""))
+
+def geometry():
+    #Non-default options that change results, for cache keys (empty with the defaults, so keys stay put)
+    opts = current()
+    return {k: opts[k] for k in GEOMETRY if opts[k] != DEFAULTS[k]}
+
+def set_options(**opts):
+    os.environ[ENV] = to_string(check({**current(), **opts}))
+
+@contextmanager
+def options(**opts):
+    previous = os.environ.get(ENV)
+    set_options(**opts)
+    try:
+        yield
+    finally:
+        if previous is None:
+            os.environ.pop(ENV, None)
+        else:
+            os.environ[ENV] = previous
+
+def _configured(bool_op):
+    def configured_bool_op(self, args, tools, op, parallel=True):
+        opts = current()
+        #Explicit per-call settings (eg. union(tol=...)) are never weakened
+        if opts["fuzzy"] > op.FuzzyValue():
+            op.SetFuzzyValue(opts["fuzzy"])
+        op.SetUseOBB(opts["obb"])
+        return bool_op(self, args, tools, op, parallel and opts["parallel"])
+    configured_bool_op.wrapped_bool_op = bool_op
+    return configured_bool_op
+
+def install():
+    #Done on import; safe to repeat
+    if not hasattr(cq.Shape._bool_op, "wrapped_bool_op"):
+        cq.Shape._bool_op = _configured(cq.Shape._bool_op)
+
+install()
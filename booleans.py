@@ -0,0 +1,36 @@
+import cadquery as cq
+import boolean_options #Every boolean below runs with the project-wide OCCT settings
+
+#Batched booleans: one OCCT boolean with every tool as an argument, instead of one full
+#boolean per tool against an ever-growing solid
+#  part = fuse_all(part, [nub.rotate(...) for ...])
+
+def tool_shapes(tools):
+    #Flatten Workplanes and compounds so each solid is passed to OCCT as its own tool
+    shapes = []
+    for t in tools:
+        vals = t.vals() if isinstance(t, cq.Workplane) else [t]
+        for v in vals:
+            if isinstance(v, cq.Compound):
+                shapes.extend(v.Solids())
+            elif isinstance(v, cq.Shape):
+                shapes.append(v)
+    return shapes
+
+def _apply(base, tools, op, clean):
+    tools = tool_shapes(tools)
+    if not tools:
+        return base
+    base_shape = base.findSolid() if isinstance(base, cq.Workplane) else base
+    result = getattr(base_shape, op)(*tools)
+    if clean:
+        result = result.clean()
+    if isinstance(base, cq.Workplane):
+        return base.newObject([result])
+    return result
+
+def fuse_all(base, tools, clean=True):
+    return _apply(base, tools, "fuse", clean)
+
+def cut_all(base, tools, clean=True):
+    return _apply(base, tools, "cut", clean)
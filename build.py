@@ -0,0 +1,244 @@
+import argparse
+import dataclasses
+import importlib
+import inspect
+import json
+import os
+import re
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+#Headless runner: builds StylishPart subclasses outside CQ-editor and reports per part timing
+#  python build.py --list
+#  python build.py PlantFloor MasonFloor --set n_locks=4 -j 4   (fields are only set on the parts that have them)
+#  python build.py BellSiphon --set snorkel=true --trace   (also writes bell_siphon.folded/.trace.json)
+#  python build.py Tower --watch   (rebuilds whatever a saved edit affects; see deps.py)
+#  python build.py PlantFloor --no-cache --booleans parallel=0,obb=1
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, REPO_DIR)
+sys.path.append(os.path.join(REPO_DIR, "..", "cq_style"))
+
+def snake_case(name):
+    return re.sub(r"(?<!^)(?=[A-Z])", "_", name).lower()
+
+def part_modules():
+    #Only import modules that define parts so discovery stays cheap and side effect free
+    modules = []
+    for fname in sorted(os.listdir(REPO_DIR)):
+        if not fname.endswith(".py") or fname == "build.py":
+            continue
+        with open(os.path.join(REPO_DIR, fname)) as f:
+            if "StylishPart)" in f.read():
+                modules.append(fname[:-3])
+    return modules
+
+def discover():
+    from cq_style import StylishPart
+    parts = {}
+    for mod_name in part_modules():
+        try:
+            module = importlib.import_module(mod_name)
+        except ImportError as e:
+            print(f"Skipping {mod_name}: {e}", file=sys.stderr)
+            continue
+        for (name, cls) in inspect.getmembers(module, inspect.isclass):
+            if issubclass(cls, StylishPart) and cls is not StylishPart and cls.__module__ == mod_name and "make" in vars(cls):
+                parts[name] = cls
+    return parts
+
+def buildable(cls):
+    #Whether the part can be built from its defaults (eg. TubeAdaptorI needs two TubeAdaptors passed in)
+    return all(f.default is not dataclasses.MISSING or f.default_factory is not dataclasses.MISSING for f in dataclasses.fields(cls))
+
+def part_params(cls, params):
+    #The params that are fields of cls, so one --set can go to a mixed selection of parts
+    names = {f.name for f in dataclasses.fields(cls)}
+    return {k: v for (k, v) in params.items() if k in names}
+
+def parse_params(assignments, parser=None, option="--set"):
+    params = {}
+    for a in assignments or []:
+        key, eq, value = a.partition("=")
+        if not eq or not key:
+            message = f"{option}: expected NAME=VALUE, got {a!r}"
+            if parser is None:
+                raise ValueError(message)
+            parser.error(message)
+        try:
+            params[key] = json.loads(value)
+        except json.JSONDecodeError:
+            params[key] = value
+    return params
+
+def parse_range(value):
+    #"start:stop:num" (inclusive) or a comma separated list of JSON values
+    if value.count(":") == 2:
+        (start, stop, num) = value.split(":")
+        num = int(num)
+        return [float(start) + (float(stop)-float(start))*i/max(num-1, 1) for i in range(num)]
+    return [json.loads(v) for v in value.split(",")]
+
+def set_booleans(parser, text):
+    #Validated and put in the environment, so worker processes run their booleans with the same settings
+    import boolean_options
+    try:
+        boolean_options.set_options(**boolean_options.parse(text))
+    except ValueError as e:
+        parser.error(f"--booleans: {e}")
+
+def build_part(module, name, params, out_dir, fmt, trace=False):
+    #Runs in a fresh worker process so ru_maxrss is the peak of this part alone
+    import boolean_options #Also applies the --booleans settings to parts that don't import a helper module
+    cls = getattr(importlib.import_module(module), name)
+    params = part_params(cls, params)
+    part = cls(**params)
+    t_start = time.perf_counter()
+    if trace:
+        from tracing import Tracer
+        with Tracer(name) as tracer:
+            result = part.part()
+        tracer.save(os.path.join(out_dir, snake_case(name)))
+    else:
+        result = part.part()
+    build_s = time.perf_counter() - t_start
+    from part_cache import held_shapes, memory_mb
+    held = held_shapes(result)
+    rss_mb = memory_mb()
+
+    ext = fmt
+    if ext == "auto":
+        ext = "step" if type(result).__name__ == "Assembly" else "stl"
+    path = os.path.join(out_dir, f"{snake_case(name)}.{ext}")
+    from exports import export_if_changed
+    from meshing import part_tolerance
+    t_start = time.perf_counter()
+    export = export_if_changed(result, path, tolerance=part_tolerance(part))
+    export_s = time.perf_counter() - t_start
+
+    return {
+        "part": name,
+        "params": params,
+        "output": path,
+        "build_s": build_s,
+        "export_s": export_s,
+        "export_status": export["status"], #written, same output or unchanged (see exports.py)
+        "export_reason": export["reason"],
+        "held_shapes": held, #Shapes the result kept alive (1 with --compact)
+        "rss_mb": rss_mb, #Resident memory while the result was held
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def print_report(rows):
+    print(f"{'part':<20}{'build s':>10}{'export s':>10}{'held':>8}{'RSS MB':>10}{'peak MB':>10}  output")
+    for r in rows:
+        if "error" in r:
+            print(f"{r['part']:<20}{'failed':>10}{'':>10}{'':>8}{'':>10}{'':>10}  {r['error']}")
+        else:
+            print(f"{r['part']:<20}{r['build_s']:>10.2f}{r['export_s']:>10.2f}{r['held_shapes']:>8}{r['rss_mb']:>10.0f}{r['peak_rss_mb']:>10.0f}  {r['output']} ({r['export_status']}{': ' + r['export_reason'] if r['export_reason'] else ''})")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build cq_hydro parts headlessly")
+    parser.add_argument("parts", nargs="*", help="Part class names to build (default: all)")
+    parser.add_argument("--list", action="store_true", help="List buildable parts and exit")
+    parser.add_argument("--set", action="append", metavar="FIELD=VALUE", help="Override a part field (JSON value)")
+    parser.add_argument("-o", "--out-dir", default="stl")
+    parser.add_argument("-f", "--format", default="auto", choices=["auto", "stl", "step"])
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Parts built concurrently")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore the part cache")
+    parser.add_argument("--json", help="Also write the timing report to this file")
+    parser.add_argument("-q", "--quality", default="final", choices=["final", "preview"], help="Build quality (preview skips cosmetic features)")
+    parser.add_argument("--force-export", action="store_true", help="Rewrite outputs even when the export manifest shows them unchanged")
+    parser.add_argument("--compact", action="store_true", help="Keep only the final solid of each part, not its build history")
+    parser.add_argument("--booleans", metavar="NAME=VALUE,...", help="OCCT boolean settings: parallel, fuzzy, obb (see boolean_options.py)")
+    parser.add_argument("--trace", action="store_true", help="Profile every CadQuery operation (implies --no-cache)")
+    parser.add_argument("--watch", action="store_true", help="Keep running and rebuild the parts affected by each saved edit")
+    parser.add_argument("--interval", type=float, default=0.5, help="Seconds between source checks in --watch mode")
+    args = parser.parse_args(argv)
+
+    #Set in the environment so worker processes build at the same quality
+    os.environ["CQ_HYDRO_QUALITY"] = args.quality
+    if args.no_cache or args.trace:
+        os.environ["CQ_HYDRO_NO_CACHE"] = "1"
+    if args.compact:
+        os.environ["CQ_HYDRO_COMPACT"] = "1"
+    if args.force_export:
+        os.environ["CQ_HYDRO_FORCE_EXPORT"] = "1"
+    if args.booleans is not None:
+        set_booleans(parser, args.booleans)
+
+    parts = discover()
+    if args.list:
+        for (name, cls) in sorted(parts.items()):
+            print(f"{name:<20}{cls.__module__}")
+        return 0
+
+    unknown = [p for p in args.parts if p not in parts]
+    if unknown:
+        parser.error(f"unknown part(s): {', '.join(unknown)}")
+    unbuildable = [p for p in args.parts if not buildable(parts[p])]
+    if unbuildable:
+        parser.error(f"{', '.join(unbuildable)} can't be built from defaults (build them from a script)")
+    #By default every part that can be built from its defaults
+    names = args.parts or sorted(n for n in parts if buildable(parts[n]))
+    params = parse_params(args.set, parser)
+    unused = [k for k in params if not any(k in part_params(parts[n], params) for n in names)]
+    if unused:
+        parser.error(f"no selected part has field(s) {', '.join(unused)}")
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    rows = build_all(parts, names, params, args)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+    if args.watch:
+        watch(parts, names, params, args)
+    return 1 if any("error" in r for r in rows) else 0
+
+def build_all(parts, names, params, args):
+    #Every part is built by a fresh worker process, so it always runs the source as currently saved
+    rows = []
+    with ProcessPoolExecutor(max_workers=args.jobs, mp_context=get_context("spawn"), max_tasks_per_child=1) as pool:
+        futures = [(n, pool.submit(build_part, parts[n].__module__, n, params, args.out_dir, args.format, args.trace)) for n in names]
+        for (name, future) in futures:
+            try:
+                rows.append(future.result())
+            except Exception as e:
+                rows.append({"part": name, "error": f"{type(e).__name__}: {e}"})
+    print_report(rows)
+    return rows
+
+def source_mtimes():
+    return {f: os.stat(os.path.join(REPO_DIR, f)).st_mtime for f in os.listdir(REPO_DIR) if f.endswith(".py")}
+
+def watch(parts, names, params, args):
+    #Polls the source files; after a save only the requested parts whose dependency hash changed are rebuilt,
+    #and those find their unchanged sub-parts in the part cache
+    from deps import PartGraph, changed_parts
+    qualnames = {n: f"{parts[n].__module__}.{n}" for n in names}
+    hashes = PartGraph().hashes()
+    mtimes = source_mtimes()
+    print(f"Watching {REPO_DIR} (Ctrl+C to stop)", flush=True)
+    try:
+        while True:
+            time.sleep(args.interval)
+            if source_mtimes() == mtimes:
+                continue
+            mtimes = source_mtimes()
+            new_hashes = PartGraph().hashes()
+            changed = changed_parts(hashes, new_hashes)
+            hashes = new_hashes
+            stale = [n for n in names if qualnames[n] in changed]
+            if not stale:
+                print("No requested part affected", flush=True)
+                continue
+            print(f"Changed: {', '.join(p.rpartition('.')[2] for p in changed)}; rebuilding {', '.join(stale)}", flush=True)
+            build_all(parts, stale, params, args)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+import ast
+import hashlib
+import os
+import sys
+
+#Dependency graph between parts, read statically from the source files (nothing is imported)
+#Each part class depends on its own source, its base classes, every part class its body names (eg. PlantFloor
+#names BellSiphon in calc_vars, Sprinkler builds a TubeAdaptor) and the helper modules it can reach.
+#Helper modules are local modules without parts, and the top-level code of a part module also counts.
+#part_cache keys use these hashes, so editing one part only invalidates that part and its dependents
+#  python deps.py                      (every part and what it depends on)
+#  python deps.py --dependents Sprinkler
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_CLASS = "StylishPart"
+
+class Module:
+    def __init__(self, name, path):
+        self.name = name
+        with open(path) as f:
+            self.source = f.read()
+        self.tree = ast.parse(self.source)
+        self.lines = self.source.splitlines(keepends=True)
+        self.classes = {n.name: n for n in self.tree.body if isinstance(n, ast.ClassDef)}
+        self.imports = {} #Local name -> (module, name or None for a whole module)
+        for node in self.tree.body:
+            if isinstance(node, ast.Import):
+                for a in node.names:
+                    self.imports[a.asname or a.name] = (a.name, None)
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                for a in node.names:
+                    self.imports[a.asname or a.name] = (node.module, a.name)
+
+    def segment(self, node):
+        #Whole source lines of a top-level statement, decorators included
+        start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+        return "".join(self.lines[start-1:node.end_lineno])
+
+def _is_editor_block(node):
+    #`if "show_object" in locals():` blocks only run inside CQ-editor
+    return isinstance(node, ast.If) and "show_object" in ast.dump(node.test)
+
+def _names(node):
+    #Plain names and module.attribute pairs used anywhere under node
+    for n in ast.walk(node):
+        if isinstance(n, ast.Name):
+            yield (n.id, None)
+        elif isinstance(n, ast.Attribute) and isinstance(n.value, ast.Name):
+            yield (n.value.id, n.attr)
+
+class PartGraph:
+    def __init__(self, repo_dir=REPO_DIR):
+        self.modules = {}
+        for fname in sorted(os.listdir(repo_dir)):
+            if fname.endswith(".py"):
+                try:
+                    self.modules[fname[:-3]] = Module(fname[:-3], os.path.join(repo_dir, fname))
+                except SyntaxError:
+                    continue #Half-saved file; its parts are left out until it parses again
+        self.parts = self._find_parts()
+        self.units = {} #Unit -> (text, [units it depends on]); units are ("class", "mod.Class") or ("module", "mod")
+        for (qualname, (module, node)) in self.parts.items():
+            self.units[("class", qualname)] = (module.segment(node), self._class_edges(module, node))
+        for module in self.modules.values():
+            self.units[("module", module.name)] = self._module_unit(module)
+        self._hashes = {}
+
+    def _find_parts(self):
+        #Classes deriving (through any chain of local classes) from StylishPart
+        parts = {}
+        changed = True
+        while changed:
+            changed = False
+            for module in self.modules.values():
+                for (name, node) in module.classes.items():
+                    qualname = f"{module.name}.{name}"
+                    if qualname in parts:
+                        continue
+                    for base in node.bases:
+                        base_name = base.id if isinstance(base, ast.Name) else None
+                        if base_name == ROOT_CLASS or self.resolve(module, base_name) in parts:
+                            parts[qualname] = (module, node)
+                            changed = True
+                            break
+        return parts
+
+    def resolve(self, module, name, attr=None):
+        #Qualified part class a name refers to in module, if any
+        if name is None:
+            return None
+        if attr is None and name in module.classes:
+            return f"{module.name}.{name}"
+        if name in module.imports:
+            (source, imported) = module.imports[name]
+            if imported is None and attr is not None:
+                return f"{source}.{attr}"
+            if imported is not None and attr is None:
+                return f"{source}.{imported}"
+        return None
+
+    def _local_import_edges(self, module, nodes):
+        edges = set()
+        for node in nodes:
+            for (name, attr) in _names(node):
+                qualname = self.resolve(module, name, attr)
+                if qualname in self.parts:
+                    edges.add(("class", qualname))
+                elif name in module.imports and module.imports[name][0] in self.modules:
+                    edges.add(("module", module.imports[name][0]))
+        return edges
+
+    def _class_edges(self, module, node):
+        edges = self._local_import_edges(module, [node])
+        edges.discard(("class", f"{module.name}.{node.name}"))
+        edges.add(("module", module.name))
+        return sorted(edges)
+
+    def _module_unit(self, module):
+        #Top-level code of a module, without its part classes and CQ-editor blocks
+        top = [n for n in module.tree.body if not (
+            (isinstance(n, ast.ClassDef) and f"{module.name}.{n.name}" in self.parts) or _is_editor_block(n)
+        )]
+        edges = self._local_import_edges(module, top)
+        #Whatever is imported from a local module needs that module's top-level code
+        for (source, _) in module.imports.values():
+            if source in self.modules:
+                edges.add(("module", source))
+        edges.discard(("module", module.name))
+        return ("".join(module.segment(n) + "\n" for n in top), sorted(edges))
+
+    def closure(self, unit):
+        seen = set()
+        stack = [unit]
+        while stack:
+            u = stack.pop()
+            if u in seen or u not in self.units:
+                continue
+            seen.add(u)
+            stack.extend(self.units[u][1])
+        return seen
+
+    def unit_hash(self, unit):
+        if unit not in self._hashes:
+            h = hashlib.sha256()
+            for u in sorted(self.closure(unit)):
+                h.update(repr(u).encode())
+                h.update(self.units[u][0].encode())
+            self._hashes[unit] = h.hexdigest()
+        return self._hashes[unit]
+
+    def part_hash(self, qualname):
+        #Hash of everything the part's build can depend on
+        return self.unit_hash(("class", qualname))
+
+    def module_hash(self, name):
+        #Hash of a module's top-level code (eg. the functions in primitives.py) and what it reaches
+        return self.unit_hash(("module", name))
+
+    def dependencies(self, qualname):
+        #Other part classes the part depends on, directly or through other parts
+        return sorted(u[1] for u in self.closure(("class", qualname)) if u[0] == "class" and u[1] != qualname)
+
+    def dependents(self, qualname):
+        return sorted(p for p in self.parts if p != qualname and qualname in self.dependencies(p))
+
+    def hashes(self):
+        return {p: self.part_hash(p) for p in self.parts}
+
+_graph = None
+
+def graph():
+    #Graph of the source as it was when first asked for; reset() after editing files
+    global _graph
+    if _graph is None:
+        _graph = PartGraph()
+    return _graph
+
+def reset():
+    global _graph
+    _graph = None
+
+def changed_parts(old_hashes, new_hashes):
+    return sorted(p for p in new_hashes if old_hashes.get(p) != new_hashes[p])
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Show the dependency graph between cq_hydro parts")
+    parser.add_argument("--dependents", metavar="PART", help="Parts that must be rebuilt when PART changes")
+    args = parser.parse_args(argv)
+    g = graph()
+    short = {q.rpartition(".")[2]: q for q in g.parts}
+    if args.dependents:
+        if args.dependents not in short:
+            parser.error(f"unknown part {args.dependents}")
+        for p in g.dependents(short[args.dependents]):
+            print(p)
+        return 0
+    for p in sorted(g.parts):
+        print(f"{p:<32}{', '.join(d.rpartition('.')[2] for d in g.dependencies(p)) or '-'}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,261 @@
+import cadquery as cq
+import atexit
+import fcntl
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+
+from part_cache import shape_to_brep, brep_to_shape, to_shape
+import meshing
+
+#Background export of finished parts, so assembly and display never wait on tessellation or disk
+#Shapes are shipped to worker processes as BRep and every file is tessellated and written concurrently
+#Files are written next to their destination and renamed into place, so nobody ever reads a partial file
+#Each output directory keeps a manifest (.exports.json) with a hash of what every file was exported from
+#and a hash of the file itself. An export whose input hasn't changed is skipped (no tessellation, no
+#write), and a re-export that comes out byte for byte the same leaves the old file (and its mtime) alone,
+#so slicers and other tools watching the files only see real changes
+#STL, 3MF and GLB files are written from meshing.mesh(), so one tessellation serves every mesh format
+#  exports.submit(floor_body, "stl/plant_floor.stl")
+#  exports.report(exports.wait())
+#  python exports.py stl      (what the last export of each file in stl/ did, and why)
+
+MANIFEST = ".exports.json"
+FORMAT_VERSION = 2 #Bump when export settings change, to rewrite every file once
+
+def _file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _given_name(name):
+    #cq.Assembly names unnamed children with a fresh uuid, which would change the hash on every build
+    try:
+        uuid.UUID(name)
+        return None
+    except ValueError:
+        return name
+
+def input_hash(obj, ext, tolerance=None):
+    #Hash of the geometry (see meshing.fingerprint; plus names, placement and colors for assemblies) and export settings
+    h = hashlib.sha256(json.dumps({"format": ext.lower(), "version": FORMAT_VERSION, "tolerance": tolerance}).encode())
+    if isinstance(obj, cq.Assembly):
+        for (name, a) in obj.traverse():
+            (position, rotation) = a.loc.toTuple()
+            color = meshing.rounded(a.color.toTuple()) if a.color else None
+            shapes = [meshing.fingerprint(s) for s in a.shapes]
+            h.update(json.dumps([_given_name(name), meshing.rounded(position), meshing.rounded(rotation), color, shapes]).encode())
+    else:
+        h.update(meshing.shape_hash(to_shape(obj)).encode())
+    return h.hexdigest()
+
+@contextmanager
+def manifest(directory):
+    #Manifest of a directory, locked against other exporting processes and saved on exit
+    directory = directory or "."
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, MANIFEST)
+    with open(path + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                entries = json.load(f)
+        yield entries
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+
+def stale_reason(entry, key, path):
+    #Why path needs exporting again, or None if it's up to date
+    if entry is None:
+        return "new"
+    if not os.path.exists(path):
+        return "missing"
+    if entry["input"] != key:
+        return "input changed"
+    st = os.stat(path)
+    if (st.st_size, st.st_mtime_ns) != (entry["size"], entry["mtime_ns"]) and _file_hash(path) != entry["output"]:
+        return "file edited"
+    return None
+
+def _write(obj, tmp_path, ext, tolerance=None):
+    if ext.lower() in meshing.FORMATS:
+        meshing.write(obj.toCompound() if isinstance(obj, cq.Assembly) else to_shape(obj), tmp_path, tolerance)
+    elif isinstance(obj, cq.Assembly):
+        if ext.lower() in (".step", ".stp"):
+            obj.export(tmp_path, "STEP")
+        else:
+            cq.exporters.export(obj.toCompound(), tmp_path)
+    else:
+        cq.exporters.export(obj, tmp_path)
+
+def export_if_changed(obj, path, force=False, tolerance=None):
+    #Exports obj to path unless the manifest shows path already holds it; returns what was done and why
+    #tolerance: (linear, angular) for mesh formats, eg. meshing.part_tolerance(part); None chooses from the shape
+    #CQ_HYDRO_FORCE_EXPORT in the environment forces every export, like force
+    force = force or os.environ.get("CQ_HYDRO_FORCE_EXPORT", "") != ""
+    (directory, name) = os.path.split(path)
+    root, ext = os.path.splitext(path)
+    key = input_hash(obj, ext, tolerance)
+    with manifest(directory) as entries:
+        entry = entries.get(name)
+        reason = stale_reason(entry, key, path)
+        if reason is None and not force:
+            entry.update({"status": "unchanged", "reason": "", "checked": time.time()})
+            return {"path": path, "status": "unchanged", "reason": ""}
+    reason = reason or "forced"
+
+    #Exported without holding the lock, so files in one directory are still written concurrently
+    tmp_path = f"{root}.{os.getpid()}.tmp{ext}"
+    try:
+        _write(obj, tmp_path, ext, tolerance)
+        output = _file_hash(tmp_path)
+        if os.path.exists(path) and _file_hash(path) == output:
+            status = "same output"
+        else:
+            os.replace(tmp_path, path)
+            status = "written"
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    st = os.stat(path)
+    with manifest(directory) as entries:
+        entries[name] = {
+            "input": key, "output": output, "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+            "status": status, "reason": reason, "checked": time.time(),
+        }
+    return {"path": path, "status": status, "reason": reason}
+
+def atomic_export(obj, path, force=False, tolerance=None):
+    return export_if_changed(obj, path, force, tolerance)["path"]
+
+def _export_brep(data, path, force=False, tolerance=None):
+    return export_if_changed(brep_to_shape(data), path, force, tolerance)
+
+def report(records):
+    #One line per export: written, same output (re-exported but identical) or unchanged (skipped)
+    for r in records:
+        if not isinstance(r, dict):
+            continue #Results of call()
+        reason = f"  ({r['reason']})" if r["reason"] else ""
+        print(f"{r['status']:<13}{r['path']}{reason}")
+
+class ExportQueue:
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self._processes = None #Started on first submit so importing this module stays cheap
+        self._threads = ThreadPoolExecutor(max_workers=1)
+        self._futures = []
+        #call() jobs on the background thread may submit more exports while the caller does too
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=get_context("spawn"))
+            return self._processes
+
+    def _add(self, future):
+        with self._lock:
+            self._futures.append(future)
+        return future
+
+    def submit(self, obj, path, force=False, tolerance=None):
+        #Queues obj (Workplane, Shape or Assembly) to be written to path
+        #Returns a Future of the export record (see export_if_changed)
+        shape = None if isinstance(obj, cq.Assembly) else to_shape(obj)
+        if shape is None:
+            #Assemblies can't be shipped as a single BRep, so they are written by a background thread
+            future = self._threads.submit(export_if_changed, obj, path, force, tolerance)
+        else:
+            future = self._pool().submit(_export_brep, shape_to_brep(shape), path, force, tolerance)
+        return self._add(future)
+
+    def call(self, fn, *args, **kwargs):
+        #Runs any other export step (eg. StylishPart.export) on the background thread
+        return self._add(self._threads.submit(fn, *args, **kwargs))
+
+    def wait(self):
+        #Blocks until everything queued so far is written, including exports queued by jobs that were
+        #still running; re-raises the first failure
+        errors = []
+        results = []
+        while True:
+            with self._lock:
+                futures, self._futures = self._futures, []
+            if not futures:
+                break
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    errors.append(e)
+        if errors:
+            raise errors[0]
+        return results
+
+    def close(self):
+        try:
+            return self.wait()
+        finally:
+            self._threads.shutdown()
+            with self._lock:
+                (processes, self._processes) = (self._processes, None)
+            if processes is not None:
+                processes.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+_queue = None
+
+def queue():
+    #Shared queue used by parts that export while they assemble; flushed at interpreter exit
+    global _queue
+    if _queue is None:
+        _queue = ExportQueue()
+        atexit.register(_queue.close)
+    return _queue
+
+def submit(obj, path, force=False, tolerance=None):
+    return queue().submit(obj, path, force, tolerance)
+
+def call(fn, *args, **kwargs):
+    return queue().call(fn, *args, **kwargs)
+
+def wait():
+    return queue().wait() if _queue is not None else []
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Show what the last export of each file in a directory did")
+    parser.add_argument("directory", nargs="?", default="stl")
+    args = parser.parse_args(argv)
+    path = os.path.join(args.directory, MANIFEST)
+    if not os.path.exists(path):
+        parser.error(f"no export manifest in {args.directory}")
+    with open(path) as f:
+        entries = json.load(f)
+    for (name, e) in sorted(entries.items(), key=lambda item: -item[1]["checked"]):
+        checked = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(e["checked"]))
+        reason = f"  ({e['reason']})" if e["reason"] else ""
+        print(f"{checked}  {e['status']:<13}{name}{reason}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,44 @@
+import numpy as np
+
+#Vectorized water volume and flow maths for the hydraulic analyses
+#Lengths are mm, volumes mm^3 and times s; flows are passed in and reported as mL/s
+#  tris = mesh_triangles(cavity)
+#  volumes = volume_below(tris, np.linspace(0, 50, 500))
+
+G = 9810 #Gravity, mm/s^2
+ML = 1000 #mm^3 per mL
+
+def mesh_triangles(shape, tolerance=0.05):
+    #(n, 3, 3) array of the triangle corners of a closed shape, oriented outwards
+    (vertices, triangles) = shape.tessellate(tolerance)
+    points = np.array([(v.x, v.y, v.z) for v in vertices])
+    return points[np.array(triangles)]
+
+def volume_below(tris, heights, chunk=64):
+    #Volume of the closed mesh below each height, all heights at once
+    #Divergence theorem with F = (0, 0, z-h): the cut face at z=h contributes nothing, so
+    #V(h) = -sum(n_z*area * E[(h-z)+]) over triangles, and z is linear over each triangle,
+    #so E[(h-z)+] has a closed form in the triangle's sorted corner heights a <= c <= b
+    nz_area = np.cross(tris[:,1]-tris[:,0], tris[:,2]-tris[:,0])[:,2] / 2
+    (a, c, b) = np.sort(tris[:,:,2], axis=1).T
+    mean = (a + b + c) / 3
+    heights = np.atleast_1d(np.asarray(heights, dtype=float))
+    volumes = np.empty(len(heights))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for i in range(0, len(heights), chunk):
+            h = heights[i:i+chunk, None]
+            rising = (h - a)**3 / (3*(b - a)*(c - a))
+            falling = h - mean + (b - h)**3 / (3*(b - a)*(b - c))
+            g = np.where(h <= a, 0, np.where(h <= c, rising, np.where(h < b, falling, h - mean)))
+            volumes[i:i+chunk] = -(np.nan_to_num(g) * nz_area).sum(axis=1)
+    return volumes
+
+def orifice_flow(area, head, cd=0.6):
+    #Flow (mm^3/s) through an orifice or pipe of area (mm^2) under head (mm) of water
+    return cd * area * np.sqrt(2 * G * np.clip(head, 0, None))
+
+def slot_flow(head, slot_h, width, cd=0.6):
+    #Flow (mm^3/s) through a vertical slot (or any opening approximated by one) whose bottom is head (mm) below the water
+    #Weir flow while the slot is partly submerged, tending to orifice flow once it is covered
+    top = np.clip(head - slot_h, 0, None)
+    return cd * width * np.sqrt(2 * G) * 2/3 * (np.clip(head, 0, None)**1.5 - top**1.5)
@@ -1,5 +1,8 @@
 from dataclasses import dataclass
 import cadquery as cq
+from booleans import fuse_all, cut_all
+from patterns import circular_pattern
+import primitives
 
 @dataclass
 class LockingNetcup:
@@ -14,15 +17,11 @@ class LockingNetcup:
     lock_nub_diam: float = 3
 
     def lock_nubs(self, net):
-        nub = cq.Workplane("XZ").circle(self.lock_nub_diam/2).extrude(-self.lock_nub_diam/2)
-        nub = nub.faces(">Y").fillet(self.lock_nub_diam/4)
+        nub = primitives.lock_nub(self.lock_nub_diam, -self.lock_nub_diam/2)
         nub = nub.translate((0,self.net_top_diam/2,self.net_h-self.lock_h + self.lock_nub_diam/2+1))
 
         #Revolve around center
-        for i in range(self.n_locks):
-            offset_angle = i * 360 / self.n_locks 
-            net = net.union(nub.rotate((0,0,0), (0,0,1), offset_angle))
-        return net
+        return fuse_all(net, [circular_pattern(nub, self.n_locks)])
 
     def make(self):
         #Create outer profile
@@ -47,8 +46,7 @@ class LockingNetcup:
         slot_h_from_top = 14
         slot = cq.Workplane("XZ").workplane(origin=(0,0,self.wall_thick))
         slot = slot.rect(10, self.net_h-self.wall_thick - slot_h_from_top, centered=[1, 0]).extrude(30)
-        for i in range(n_slots):
-            c = c.cut(slot.rotate((0,0,0), (0,0,1), i*slot_angle))
+        c = cut_all(c, [slot.rotate((0,0,0), (0,0,1), i*slot_angle) for i in range(n_slots)])
         c = self.lock_nubs(c)
 
         return c
@@ -1,5 +1,7 @@
 import cadquery as cq
 from dataclasses import dataclass
+import quality
+from part_cache import cached_make
 
 import sys
 sys.path.append("../cq_style")
@@ -16,9 +18,15 @@ class MasonThread(StylishPart):
     thread_contour_diam: float = 3.2
     thread_contour_h: float = 2.2
     thread_r: float = mason_thread_od/2 + thread_contour_diam 
+    thread_construction: str = "sweep" #"sweep": split the threaded ring at its base, "trimmed": trim the thread before joining it (faster)
 
-    def make(self, export_stl=0):
-
+    @cached_make
+    def threaded_ring(self):
+        #Memoized, so every part embedding an identical thread reuses it instead of re-sweeping the helix
+        mason_thread = cq.Workplane("XY").circle(self.thread_r+self.wall_thick).circle(self.thread_r).extrude(self.lid_h)
+        if quality.preview():
+            #Plain ring in place of the threads
+            return mason_thread
 
         # Helix
         helix_wire = cq.Wire.makeHelix(pitch=self.thread_pitch, height=self.thread_h, radius=self.thread_r)
@@ -34,8 +42,14 @@ class MasonThread(StylishPart):
         )
         #show_object(threads)
 
-        mason_thread = cq.Workplane("XY").circle(self.thread_r+self.wall_thick).circle(self.thread_r).extrude(self.lid_h)
-        mason_thread = mason_thread.union(threads).faces("XY").workplane(origin=(0,0,0)).split(1,0)
+        if self.thread_construction == "trimmed":
+            #Cutting the start of the thread off alone is cheaper than splitting the joined ring
+            below = cq.Workplane("XY").rect(4*self.thread_r, 4*self.thread_r).extrude(-self.thread_contour_diam)
+            return mason_thread.union(threads.cut(below))
+        return mason_thread.union(threads).faces("XY").workplane(origin=(0,0,0)).split(1,0)
+
+    def make(self, export_stl=0):
+        mason_thread = self.threaded_ring()
 
         if export_stl:
             cq.exporters.export(mason_thread, "stl/mason_thread.stl")
@@ -0,0 +1,225 @@
+import hashlib
+import json
+import os
+import zipfile
+from collections import OrderedDict
+
+import numpy as np
+import cadquery as cq
+from OCP.BRep import BRep_Tool
+from OCP.BRepMesh import BRepMesh_IncrementalMesh
+from OCP.TopAbs import TopAbs_REVERSED
+from OCP.TopLoc import TopLoc_Location
+
+import part_cache
+
+#Tessellation for mesh exports (STL, 3MF, GLB)
+#Meshes use an absolute deflection chosen from the shape's smallest curved feature and overall size, with an
+#angular limit, so small features (airstone holes, lock fillets) and small parts stay round while large
+#walls aren't cut into needless slivers. A part can override either with mesh_tolerance / mesh_angular_tolerance
+#attributes (eg. the airstones follow their air hole size, the tower floors use MAX_TOLERANCE)
+#Each (shape, tolerance) is tessellated once and kept in memory and next to the part cache, and every
+#writer takes the same mesh, so exporting one part to STL, 3MF and GLB tessellates it once
+#  (vertices, triangles) = meshing.mesh(shape)
+#  meshing.write(shape, "stl/plant_floor.3mf", meshing.part_tolerance(floor))
+
+MIN_TOLERANCE = 0.005 #mm
+MAX_TOLERANCE = 0.05 #mm, about the resolution of an FDM print
+FEATURE_FRACTION = 0.1 #Linear tolerance as a fraction of the smallest feature
+SIZE_FRACTION = 0.0005 #and of the bounding box diagonal
+ANGULAR_TOLERANCE = 0.3 #rad; larger curves get their segments from the linear tolerance
+FORMATS = (".stl", ".3mf", ".glb")
+MESH_DIR = os.path.join(part_cache.CACHE_DIR, "mesh")
+LRU_SIZE = 8
+
+_memory = OrderedDict()
+stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+def rounded(values, digits=5):
+    #+0.0 turns -0.0 into 0.0
+    return [round(v, digits) + 0.0 for v in values]
+
+def fingerprint(shape):
+    #Topology counts, volume, area and every vertex position of a shape
+    #BRep text isn't usable: the same solid reloaded from the part cache serializes differently
+    return [
+        len(shape.Solids()), len(shape.Faces()), len(shape.Edges()),
+        rounded([shape.Volume(), shape.Area()], 3),
+        sorted(rounded(v.toTuple()) for v in shape.Vertices()),
+    ]
+
+def shape_hash(shape):
+    return hashlib.sha256(json.dumps(fingerprint(shape)).encode()).hexdigest()
+
+def feature_size(shape):
+    #Smallest radius of a circular edge (or length of another curved edge); straight edges mesh exactly
+    sizes = []
+    for e in shape.Edges():
+        kind = e.geomType()
+        if kind == "CIRCLE":
+            sizes.append(e.radius())
+        elif kind == "ELLIPSE":
+            sizes.append(e._geomAdaptor().Ellipse().MinorRadius())
+        elif kind != "LINE":
+            sizes.append(e.Length())
+    sizes = [s for s in sizes if s > 1e-6]
+    return min(sizes) if sizes else None
+
+def tolerances(shape, tolerance=None):
+    #(linear, angular) for shape; tolerance is an optional (linear, angular) pair whose set values win
+    (linear, angular) = tolerance or (None, None)
+    if linear is None:
+        #Size from the vertices: BoundingBox() also counts any triangulation, so it changes once meshed
+        points = np.array([v.toTuple() for v in shape.Vertices()])
+        linear = np.linalg.norm(points.max(axis=0) - points.min(axis=0)) * SIZE_FRACTION if len(points) else MAX_TOLERANCE
+        feature = feature_size(shape)
+        if feature is not None:
+            linear = min(linear, feature * FEATURE_FRACTION)
+        linear = float(min(MAX_TOLERANCE, max(MIN_TOLERANCE, linear)))
+    return (linear, ANGULAR_TOLERANCE if angular is None else angular)
+
+def part_tolerance(part):
+    #A part's own (linear, angular) override, or None to choose from the shape
+    override = (getattr(part, "mesh_tolerance", None), getattr(part, "mesh_angular_tolerance", None))
+    return None if override == (None, None) else override
+
+def _triangulate(shape, linear, angular):
+    #Meshes a copy of the shape and gathers every face's triangles
+    #The shape itself is shared (part cache, cached_shape primitives, floors placed at several Locations),
+    #and meshing it in place would change the triangulation every other holder sees
+    shape = shape.copy()
+    BRepMesh_IncrementalMesh(shape.wrapped, linear, False, angular, True)
+    vertices = []
+    triangles = []
+    offset = 0
+    for f in shape.Faces():
+        loc = TopLoc_Location()
+        poly = BRep_Tool.Triangulation_s(f.wrapped, loc)
+        if poly is None:
+            continue
+        trsf = loc.Transformation()
+        n = poly.NbNodes()
+        vertices.append(np.array([poly.Node(i).Transformed(trsf).Coord() for i in range(1, n+1)]))
+        t = np.array([poly.Triangle(i).Get() for i in range(1, poly.NbTriangles()+1)], dtype=np.int64) - 1
+        if f.wrapped.Orientation() == TopAbs_REVERSED:
+            t = t[:, [0, 2, 1]]
+        triangles.append(t + offset)
+        offset += n
+    if not vertices:
+        return (np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int64))
+    return (np.concatenate(vertices), np.concatenate(triangles))
+
+def mesh(shape, tolerance=None):
+    #(vertices (n, 3), triangles (m, 3) of vertex indices, outward winding) of shape
+    (linear, angular) = tolerances(shape, tolerance)
+    key = hashlib.sha256(json.dumps([shape_hash(shape), linear, angular]).encode()).hexdigest()
+    if key in _memory:
+        stats["memory_hits"] += 1
+        _memory.move_to_end(key)
+        return _memory[key]
+    path = os.path.join(MESH_DIR, key[:2], key + ".npz")
+    if part_cache.enabled and os.path.exists(path):
+        with np.load(path) as data:
+            result = (data["vertices"], data["triangles"])
+        stats["disk_hits"] += 1
+    else:
+        result = _triangulate(shape, linear, angular)
+        stats["misses"] += 1
+        if part_cache.enabled:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+            np.savez(tmp_path, vertices=result[0], triangles=result[1])
+            os.replace(tmp_path, path)
+    _memory[key] = result
+    while len(_memory) > LRU_SIZE:
+        _memory.popitem(last=False)
+    return result
+
+def write_stl(path, vertices, triangles):
+    #Binary STL
+    corners = vertices[triangles]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+    records = np.zeros(len(triangles), dtype=[("normal", "<f4", 3), ("corners", "<f4", (3, 3)), ("attr", "<u2")])
+    records["normal"] = normals
+    records["corners"] = corners
+    with open(path, "wb") as f:
+        f.write(b"cq_hydro".ljust(80, b" "))
+        f.write(np.uint32(len(triangles)).tobytes())
+        f.write(records.tobytes())
+
+def welded(vertices, triangles):
+    #Faces are meshed separately, so points on shared edges are repeated; 3MF wants one mesh with shared vertices
+    (vertices, index) = np.unique(vertices.round(6), axis=0, return_inverse=True)
+    return (vertices, index.reshape(-1)[triangles])
+
+def write_3mf(path, vertices, triangles):
+    (vertices, triangles) = welded(vertices, triangles)
+    vertex_xml = "".join(f'<vertex x="{x:.6g}" y="{y:.6g}" z="{z:.6g}"/>' for (x, y, z) in vertices.tolist())
+    triangle_xml = "".join(f'<triangle v1="{a}" v2="{b}" v3="{c}"/>' for (a, b, c) in triangles.tolist())
+    model = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<model unit="millimeter" xmlns="http://schemas.microsoft.com/3dmanufacturing/core/2015/02">'
+        f'<resources><object id="1" type="model"><mesh><vertices>{vertex_xml}</vertices>'
+        f'<triangles>{triangle_xml}</triangles></mesh></object></resources>'
+        '<build><item objectid="1"/></build></model>'
+    )
+    content_types = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="model" ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml"/>'
+        '</Types>'
+    )
+    rels = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Target="/3D/3dmodel.model" Id="rel0" Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel"/>'
+        '</Relationships>'
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        #Fixed timestamps so the same mesh always gives the same file
+        for (name, text) in [("[Content_Types].xml", content_types), ("_rels/.rels", rels), ("3D/3dmodel.model", model)]:
+            z.writestr(zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0)), text, compress_type=zipfile.ZIP_DEFLATED)
+
+def write_glb(path, vertices, triangles):
+    #Binary glTF 2.0; glTF is in metres, so the node scales the millimetre mesh down
+    positions = vertices.astype("<f4")
+    indices = triangles.astype("<u4").ravel()
+    position_bytes = positions.tobytes()
+    index_bytes = indices.tobytes()
+    gltf = {
+        "asset": {"version": "2.0", "generator": "cq_hydro"},
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": [{"mesh": 0, "scale": [0.001, 0.001, 0.001]}],
+        "meshes": [{"primitives": [{"attributes": {"POSITION": 0}, "indices": 1}]}],
+        "buffers": [{"byteLength": len(position_bytes) + len(index_bytes)}],
+        "bufferViews": [
+            {"buffer": 0, "byteOffset": 0, "byteLength": len(position_bytes), "target": 34962},
+            {"buffer": 0, "byteOffset": len(position_bytes), "byteLength": len(index_bytes), "target": 34963},
+        ],
+        "accessors": [
+            {
+                "bufferView": 0, "componentType": 5126, "count": len(positions), "type": "VEC3",
+                "min": positions.min(axis=0).tolist() if len(positions) else [0, 0, 0],
+                "max": positions.max(axis=0).tolist() if len(positions) else [0, 0, 0],
+            },
+            {"bufferView": 1, "componentType": 5125, "count": len(indices), "type": "SCALAR"},
+        ],
+    }
+    json_bytes = json.dumps(gltf, separators=(",", ":")).encode()
+    json_bytes += b" " * (-len(json_bytes) % 4)
+    bin_bytes = position_bytes + index_bytes #Both are 4-byte aligned already
+    with open(path, "wb") as f:
+        f.write(np.array([0x46546C67, 2, 12 + 8 + len(json_bytes) + 8 + len(bin_bytes)], dtype="<u4").tobytes())
+        f.write(np.array([len(json_bytes), 0x4E4F534A], dtype="<u4").tobytes() + json_bytes)
+        f.write(np.array([len(bin_bytes), 0x004E4942], dtype="<u4").tobytes() + bin_bytes)
+
+WRITERS = {".stl": write_stl, ".3mf": write_3mf, ".glb": write_glb}
+
+def write(shape, path, tolerance=None):
+    (vertices, triangles) = mesh(shape, tolerance)
+    WRITERS[os.path.splitext(path)[1].lower()](path, vertices, triangles)
+    return path
@@ -1,5 +1,6 @@
 from dataclasses import dataclass
 import cadquery as cq
+from booleans import cut_all
 
 @dataclass
 class Netcup:
@@ -31,8 +32,7 @@ class Netcup:
         slot_h_from_top = 12
         slot = cq.Workplane("XZ").workplane(origin=(0,0,self.wall_thick))
         slot = slot.rect(10, self.net_h-self.wall_thick - slot_h_from_top, centered=[1, 0]).extrude(30)
-        for i in range(n_slots):
-            c = c.cut(slot.rotate((0,0,0), (0,0,1), i*slot_angle))
+        c = cut_all(c, [slot.rotate((0,0,0), (0,0,1), i*slot_angle) for i in range(n_slots)])
 
         return c
 
@@ -0,0 +1,293 @@
+import cadquery as cq
+import copy
+import dataclasses
+import hashlib
+import io
+import json
+import os
+import resource
+import sys
+import types
+import boolean_options
+import deps
+import quality
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import wraps
+from multiprocessing import get_context
+
+#Content-addressed cache of finished part solids
+#Entries are keyed on the part class, its field values, the values derived in calc_vars() and
+#the source the part depends on (see deps.py), so editing a part invalidates it and its dependents only
+#Boolean settings that change geometry (see boolean_options.py) are part of the key when set
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.environ.get("CQ_HYDRO_CACHE_DIR", os.path.join(REPO_DIR, ".cq_cache"))
+LRU_SIZE = int(os.environ.get("CQ_HYDRO_CACHE_LRU", 64)) #Number of solids kept in memory
+enabled: bool = os.environ.get("CQ_HYDRO_NO_CACHE", "") == ""
+
+_memory: "OrderedDict[str, cq.Shape]" = OrderedDict()
+_source_hashes = {}
+stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+def _is_local(module):
+    path = getattr(module, "__file__", None)
+    return path is not None and os.path.dirname(os.path.abspath(path)) == REPO_DIR
+
+def _module_of(obj):
+    if isinstance(obj, types.ModuleType):
+        return obj
+    return sys.modules.get(getattr(obj, "__module__", None) or "")
+
+def local_modules(module, seen=None):
+    #Local modules reachable through the globals of module (ie. what it imports from this repo)
+    seen = {} if seen is None else seen
+    if module is None or not _is_local(module) or module.__name__ in seen:
+        return seen
+    seen[module.__name__] = module
+    for value in list(vars(module).values()):
+        dep = _module_of(value)
+        if dep is not None and dep is not module:
+            local_modules(dep, seen)
+    return seen
+
+def source_hash(cls):
+    if cls in _source_hashes:
+        return _source_hashes[cls]
+    qualname = f"{cls.__module__}.{cls.__qualname__}"
+    if qualname in deps.graph().parts:
+        _source_hashes[cls] = deps.graph().part_hash(qualname)
+        return _source_hashes[cls]
+    #Parts outside the graph (eg. defined in a script run by CQ-editor) depend on every module they reach
+    modules = {}
+    for base in cls.__mro__:
+        local_modules(_module_of(base), modules)
+    _source_hashes[cls] = _modules_hash(modules)
+    return _source_hashes[cls]
+
+def module_hash(name):
+    #Source hash for plain functions (see cached_shape), from the module they are defined in
+    if name not in _source_hashes:
+        if name in deps.graph().modules:
+            _source_hashes[name] = deps.graph().module_hash(name)
+        else:
+            _source_hashes[name] = _modules_hash(local_modules(sys.modules.get(name)))
+    return _source_hashes[name]
+
+def _modules_hash(modules):
+    h = hashlib.sha256()
+    for name in sorted(modules):
+        h.update(name.encode())
+        with open(modules[name].__file__, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+def _canonical(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for (k, v) in value.items()}
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return {"class": type(value).__qualname__, "state": part_state(value)}
+    #Geometry and other opaque objects do not define a part, only its parameters do
+    return type(value).__qualname__
+
+def part_state(part):
+    #Field values plus everything calc_vars() derives from them, computed on a copy so the
+    #key does not depend on whatever make() may have already mutated on the instance
+    probe = copy.copy(part)
+    if hasattr(probe, "calc_vars"):
+        probe.calc_vars()
+    exclude = getattr(type(part), "cache_exclude", ())
+    return {k: _canonical(v) for (k, v) in sorted(vars(probe).items()) if not k.startswith("_") and k not in exclude}
+
+def cache_key(part, *args, method="make", **kwargs):
+    cls = type(part)
+    payload = {
+        "class": f"{cls.__module__}.{cls.__qualname__}",
+        "state": part_state(part),
+        "args": _canonical(list(args)),
+        "kwargs": _canonical(kwargs),
+        "source": source_hash(cls),
+        "quality": quality.current(),
+    }
+    if method != "make":
+        payload["method"] = method
+    if boolean_options.geometry():
+        payload["booleans"] = boolean_options.geometry()
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+def function_key(fn, *args, **kwargs):
+    payload = {
+        "function": f"{fn.__module__}.{fn.__qualname__}",
+        "args": _canonical(list(args)),
+        "kwargs": _canonical(kwargs),
+        "source": module_hash(fn.__module__),
+        "quality": quality.current(),
+    }
+    if boolean_options.geometry():
+        payload["booleans"] = boolean_options.geometry()
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+def shape_to_brep(shape) -> bytes:
+    buf = io.BytesIO()
+    shape.exportBrep(buf)
+    return buf.getvalue()
+
+def brep_to_shape(data: bytes) -> cq.Shape:
+    return cq.Shape.importBrep(io.BytesIO(data))
+
+def to_shape(result):
+    #Single shape held by a make() result, or None if it can't be cached (eg. an Assembly)
+    if isinstance(result, cq.Shape):
+        return result
+    if isinstance(result, cq.Workplane):
+        shapes = [v for v in result.vals() if isinstance(v, cq.Shape)]
+        if len(shapes) == 1:
+            return shapes[0]
+        if len(shapes) > 1:
+            return cq.Compound.makeCompound(shapes)
+    return None
+
+def compact_results():
+    #Whether cached_make returns only the final solid (see compact()), even on a cache miss
+    #Read from the environment on every call, like quality.current(), so build.py --compact reaches workers
+    return os.environ.get("CQ_HYDRO_COMPACT", "") != ""
+
+def compact(result):
+    #A make() result reduced to its final solid in a fresh Workplane. The result of a build keeps its
+    #whole parent chain and tags, and with them every intermediate solid; dropping them frees those
+    #Shapes and Assemblies are returned as they are
+    if not isinstance(result, cq.Workplane):
+        return result
+    shape = to_shape(result)
+    if shape is None:
+        return result
+    return cq.Workplane("XY").newObject([shape])
+
+def held_shapes(result):
+    #Distinct shapes a Workplane keeps alive through its parent chain and tags (1 once compact)
+    seen = set()
+    shapes = 0
+    stack = [result] if isinstance(result, cq.Workplane) else []
+    while stack:
+        wp = stack.pop()
+        if id(wp) in seen:
+            continue
+        seen.add(id(wp))
+        shapes += sum(isinstance(o, cq.Shape) for o in wp.objects)
+        if wp.parent is not None:
+            stack.append(wp.parent)
+        stack.extend(wp.ctx.tags.values())
+    return shapes
+
+def memory_mb():
+    #Resident memory of this process now (ru_maxrss, the peak, where /proc isn't available)
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _path(key):
+    return os.path.join(CACHE_DIR, key[:2], key + ".brep")
+
+def _remember(key, shape):
+    _memory[key] = shape
+    _memory.move_to_end(key)
+    while len(_memory) > LRU_SIZE:
+        _memory.popitem(last=False)
+
+def lookup(key):
+    if key in _memory:
+        stats["memory_hits"] += 1
+        _memory.move_to_end(key)
+        return _memory[key]
+    path = _path(key)
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            shape = brep_to_shape(f.read())
+        stats["disk_hits"] += 1
+        _remember(key, shape)
+        return shape
+    return None
+
+def store(key, shape):
+    _remember(key, shape)
+    path = _path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    #Write next to the final path then rename so a crashed build never leaves a truncated entry
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(shape_to_brep(shape))
+    os.replace(tmp_path, path)
+
+def clear(disk=False):
+    _memory.clear()
+    _source_hashes.clear()
+    deps.reset()
+    if disk and os.path.isdir(CACHE_DIR):
+        import shutil
+        shutil.rmtree(CACHE_DIR)
+
+def cached_make(make):
+    #Decorator for StylishPart.make() (or any other method building a solid from the part's fields):
+    #reloads the finished solid instead of rebuilding it
+    #A hit skips make() entirely, so make() must not set attributes other code reads (derive them in
+    #calc_vars(), which is part of the key), and the returned Workplane holds only the solid: no tags,
+    #no parent chain, no workplane other than XY
+    @wraps(make)
+    def wrapper(self, *args, **kwargs):
+        if not enabled:
+            result = make(self, *args, **kwargs)
+            return compact(result) if compact_results() else result
+        key = cache_key(self, *args, method=make.__name__, **kwargs)
+        shape = lookup(key)
+        if shape is not None:
+            return cq.Workplane("XY").newObject([shape])
+        stats["misses"] += 1
+        result = make(self, *args, **kwargs)
+        shape = to_shape(result)
+        if shape is not None:
+            store(key, shape)
+            if compact_results():
+                return cq.Workplane("XY").newObject([shape])
+        return result
+    return wrapper
+
+def _build_brep(part):
+    return shape_to_brep(to_shape(part.part()))
+
+def build_many(parts, max_workers=None):
+    #Builds independent parts in worker processes, shipping each result back as BRep
+    #Results are also remembered in memory so later part() calls in this session are free
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context("spawn")) as pool:
+        breps = list(pool.map(_build_brep, parts))
+    bodies = []
+    for (part, data) in zip(parts, breps):
+        shape = brep_to_shape(data)
+        if enabled:
+            _remember(cache_key(part), shape)
+        bodies.append(cq.Workplane("XY").newObject([shape]))
+    return bodies
+
+def cached_shape(build):
+    #Decorator for plain functions building a solid from their arguments (see primitives.py):
+    #each distinct call is built once and shared through the same memory and disk cache as parts
+    @wraps(build)
+    def wrapper(*args, **kwargs):
+        if not enabled:
+            return build(*args, **kwargs)
+        key = function_key(build, *args, **kwargs)
+        shape = lookup(key)
+        if shape is not None:
+            return cq.Workplane("XY").newObject([shape])
+        stats["misses"] += 1
+        result = build(*args, **kwargs)
+        shape = to_shape(result)
+        if shape is not None:
+            store(key, shape)
+        return result
+    return wrapper
@@ -0,0 +1,204 @@
+import argparse
+import dataclasses
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import get_context
+from urllib.parse import parse_qsl, urlparse
+
+from build import discover, set_booleans, snake_case
+import boolean_options
+import part_cache
+import quality
+
+#Local part generation service
+#Builds run in a pool of worker processes that already have cadquery and every part module imported,
+#and finished files are kept in a content-addressed cache (keyed like part_cache, so a source edit
+#gives new keys), so a repeated request is a file read and a new one costs only its build
+#Restart the server after editing part modules; keys are computed from the source as it was at startup
+#  python part_server.py --port 8765 -j 4
+#  curl -o floor.stl "localhost:8765/parts/PlantFloor.stl?tower_od=90&n_locks=4"
+#  curl -o sieve.step -d '{"mini_sieve": true}' localhost:8765/parts/CrownSieve.step
+#  curl localhost:8765/parts   (buildable parts and their fields)
+
+EXPORT_DIR = os.path.join(part_cache.CACHE_DIR, "exports")
+FORMATS = {"stl": "model/stl", "step": "model/step"}
+
+def _warm():
+    #Worker initializer: pay the cadquery and part module import cost once per worker
+    import cadquery
+    discover()
+
+def _ready():
+    return os.getpid()
+
+def build_export(module, name, params, level, path):
+    #Runs in a warm worker
+    from exports import atomic_export
+    from meshing import part_tolerance
+    quality.set_level(level)
+    part = getattr(importlib.import_module(module), name)(**params)
+    t_start = time.perf_counter()
+    result = part.part()
+    build_s = time.perf_counter() - t_start
+    atomic_export(result, path, tolerance=part_tolerance(part))
+    return build_s
+
+class BadRequest(ValueError):
+    pass
+
+def parse_value(value):
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        return value
+
+class PartService:
+    def __init__(self, workers=None):
+        self.parts = discover()
+        self.workers = workers or os.cpu_count()
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm, mp_context=get_context("spawn"))
+        #Start every worker now rather than on the first requests
+        for f in [self.pool.submit(_ready) for _ in range(self.workers)]:
+            f.result()
+        self._lock = threading.Lock()
+        self._building = {} #Output path -> Future of a build in progress, shared by identical requests
+        self.stats = {"hits": 0, "builds": 0, "joined": 0, "errors": 0}
+
+    def fields(self):
+        return {
+            name: {f.name: f.default for f in dataclasses.fields(cls) if f.default is not dataclasses.MISSING and isinstance(f.default, (bool, int, float, str))}
+            for (name, cls) in sorted(self.parts.items())
+        }
+
+    def key(self, cls, params, level):
+        #quality lives in the environment, so switching it is serialized across request threads
+        with self._lock, quality.level(level):
+            return part_cache.cache_key(cls(**params))
+
+    def get(self, name, params, fmt, level=quality.FINAL):
+        #(path, status, build seconds) of the requested file, building it if needed
+        cls = self.parts[name]
+        try:
+            key = self.key(cls, params, level)
+        except (TypeError, ValueError, AttributeError) as e:
+            #Unknown fields, or values of the wrong kind (eg. a dict where calc_vars expects a part)
+            raise BadRequest(f"{type(e).__name__}: {e}")
+        path = os.path.join(EXPORT_DIR, key[:2], f"{key}.{fmt}")
+        if os.path.exists(path):
+            with self._lock:
+                self.stats["hits"] += 1
+            return (path, "hit", 0.0)
+        with self._lock:
+            future = self._building.get(path)
+            joined = future is not None
+            if not joined:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                future = self.pool.submit(build_export, cls.__module__, name, params, level, path)
+                self._building[path] = future
+        try:
+            build_s = future.result()
+        except Exception:
+            with self._lock:
+                self.stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._building.pop(path, None)
+        with self._lock:
+            self.stats["joined" if joined else "builds"] += 1
+        return (path, "joined" if joined else "miss", build_s)
+
+    def close(self):
+        self.pool.shutdown()
+
+class Handler(BaseHTTPRequestHandler):
+    service: PartService = None
+
+    def send_json(self, status, obj):
+        body = json.dumps(obj, indent=1).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.rstrip("/") == "/parts":
+            return self.send_json(200, self.service.fields())
+        if url.path.rstrip("/") == "/stats":
+            with self.service._lock:
+                stats = {**self.service.stats, "building": len(self.service._building)}
+            return self.send_json(200, {**stats, "booleans": boolean_options.current()})
+        self.serve_part(url.path, {k: parse_value(v) for (k, v) in parse_qsl(url.query)})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            params = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            return self.send_json(400, {"error": f"invalid JSON body: {e}"})
+        self.serve_part(urlparse(self.path).path, params)
+
+    def serve_part(self, path, params):
+        #/parts/<Name>.<stl|step>; a "quality" parameter picks the build quality
+        (prefix, _, filename) = path.rpartition("/")
+        (name, _, fmt) = filename.partition(".")
+        if prefix != "/parts" or fmt not in FORMATS:
+            return self.send_json(404, {"error": f"expected /parts/<Part>.<{'|'.join(FORMATS)}>"})
+        if name not in self.service.parts:
+            return self.send_json(404, {"error": f"unknown part {name}"})
+        level = params.pop("quality", quality.FINAL)
+        if level not in quality.LEVELS:
+            return self.send_json(400, {"error": f"unknown quality {level}"})
+        t_start = time.perf_counter()
+        try:
+            (file_path, status, build_s) = self.service.get(name, params, fmt, level)
+        except BadRequest as e:
+            return self.send_json(400, {"error": str(e)})
+        except Exception as e:
+            return self.send_json(500, {"error": f"{type(e).__name__}: {e}"})
+        with open(file_path, "rb") as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header("Content-Type", FORMATS[fmt])
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Content-Disposition", f'attachment; filename="{snake_case(name)}.{fmt}"')
+        self.send_header("ETag", os.path.basename(file_path))
+        self.send_header("X-Cache", status)
+        self.send_header("X-Build-Seconds", f"{build_s:.3f}")
+        self.send_header("X-Total-Seconds", f"{time.perf_counter() - t_start:.3f}")
+        self.end_headers()
+        self.wfile.write(body)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve cq_hydro parts as STL/STEP over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Warm worker processes")
+    parser.add_argument("--booleans", metavar="NAME=VALUE,...", help="OCCT boolean settings for every build: parallel, fuzzy, obb")
+    args = parser.parse_args(argv)
+    if args.booleans is not None:
+        set_booleans(parser, args.booleans) #Before the pool starts, so the workers inherit it
+
+    t_start = time.perf_counter()
+    Handler.service = PartService(args.jobs)
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"{len(Handler.service.parts)} parts, {args.jobs} workers ready in {time.perf_counter() - t_start:.1f} s; serving http://{args.host}:{args.port}/parts", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        Handler.service.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
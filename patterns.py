@@ -0,0 +1,25 @@
+import cadquery as cq
+
+#Placement of repeated tools. Copies are made with Shape.moved() so they share the tool's
+#underlying geometry, and exactly n instances are made, so cost is linear in n
+#  locks = circular_pattern(lock, self.n_locks)
+#  floor = cut_all(floor, [locks])
+
+def rotation(angle, axis=(0,0,1), center=(0,0,0)):
+    #Location rotating by angle (degrees) about the axis through center
+    c = cq.Vector(*center)
+    return cq.Location(c) * cq.Location(cq.Vector(0,0,0), cq.Vector(*axis), angle) * cq.Location(-c)
+
+def pattern(tool, locations):
+    #Compound holding one copy of tool per location
+    shape = tool.val() if isinstance(tool, cq.Workplane) and len(tool.vals()) == 1 else tool
+    if isinstance(shape, cq.Workplane):
+        shape = cq.Compound.makeCompound([v for v in shape.vals() if isinstance(v, cq.Shape)])
+    return cq.Workplane("XY").newObject([cq.Compound.makeCompound([shape.moved(loc) for loc in locations])])
+
+def circular_pattern(tool, n, start_angle=0, span=360, axis=(0,0,1), center=(0,0,0)):
+    #Exactly n copies of tool spread evenly over span degrees around axis
+    if n <= 0:
+        return pattern(tool, [])
+    step = span / n if span % 360 == 0 else span / max(n - 1, 1)
+    return pattern(tool, [rotation(start_angle + i*step, axis, center) for i in range(n)])
@@ -0,0 +1,68 @@
+import cadquery as cq
+from math import sqrt, cos, sin, radians
+
+from booleans import cut_all
+from patterns import pattern, rotation
+
+#Perforation of walls with many small holes (airstones, sieves)
+#A hole pattern is a list of (u, v) points in a wall's own coordinates; a wall turns those points into
+#Locations whose local +Z is the hole axis. All holes are then cut from the part in one boolean
+#Hole tools should only span the wall: OCCT also intersects the tools with each other, so long
+#holes that meet (eg. radial holes reaching the axis) make the batched cut drastically slower
+#  holes = flat_locations(polar_points(10, 24), cq.Plane.XY())
+#  part = perforate(part, hole(0.2, 5, centered=True), holes)
+
+def grid_points(n_u, n_v, pitch_u, pitch_v, origin=(0,0), centered=(True, True)):
+    u0 = origin[0] - (pitch_u*(n_u-1)/2 if centered[0] else 0)
+    v0 = origin[1] - (pitch_v*(n_v-1)/2 if centered[1] else 0)
+    return [(u0 + i*pitch_u, v0 + j*pitch_v) for j in range(n_v) for i in range(n_u)]
+
+def hex_points(n_u, n_v, pitch_u, pitch_v=None, origin=(0,0), centered=(True, True)):
+    #Hex packed grid: every other row is shifted by half a pitch
+    pitch_v = pitch_u*sqrt(3)/2 if pitch_v is None else pitch_v
+    points = grid_points(n_u, n_v, pitch_u, pitch_v, origin, centered)
+    return [(u + (pitch_u/2 if (k // n_u) % 2 else 0), v) for (k, (u, v)) in enumerate(points)]
+
+def polar_points(radius, n, start_angle=0, span=360):
+    step = span / n if span % 360 == 0 else span / max(n - 1, 1)
+    return [
+        (radius*cos(radians(start_angle + i*step)), radius*sin(radians(start_angle + i*step)))
+        for i in range(n)
+    ]
+
+def flat_locations(points, plane=cq.Plane.XY()):
+    #Holes normal to a planar wall; points are in the plane's local x/y
+    base = cq.Location(plane)
+    return [base * cq.Location(cq.Vector(u, v, 0)) for (u, v) in points]
+
+def cylinder_locations(points, radius=0):
+    #Holes pointing radially out of a wall around the Z axis; points are (angle in degrees, z)
+    #Each hole starts radius from the axis (eg. the wall's outer radius, for a centered hole)
+    radial = cq.Location(cq.Vector(0,0,0), cq.Vector(0,1,0), 90) * cq.Location(cq.Vector(0, 0, radius))
+    return [rotation(a) * cq.Location(cq.Vector(0, 0, z)) * radial for (a, z) in points]
+
+def lofted_locations(points, tilt, offset=0, n_sides=4, face=None):
+    #Holes through the flat sides of a loft (eg. a pyramid) which lean tilt degrees from vertical
+    #Points are (u, v) across/up each side and are repeated on all n_sides sides
+    #Holes start offset along their axis, or on the sides' outer face when face (the distance of
+    #that face from the origin, measured along its normal) is given
+    lean = cq.Location(cq.Vector(0,0,0), cq.Vector(0,1,0), tilt)
+    def start(v):
+        return cq.Location(cq.Vector(0, 0, offset if face is None else face - v*cos(radians(tilt))))
+    return [
+        rotation(i*360/n_sides) * cq.Location(cq.Vector(0, u, v)) * lean * start(v)
+        for i in range(n_sides) for (u, v) in points
+    ]
+
+def hole(r, depth, centered=False):
+    #Hole tool along +Z (or straddling the XY plane when centered)
+    return cq.Workplane("XY").circle(r).extrude(depth/2 if centered else depth, both=centered)
+
+def perforate(part, hole_tool, locations, keep_out=None):
+    if not locations:
+        return part
+    holes = pattern(hole_tool, locations)
+    if keep_out is not None:
+        #Trim every hole against the regions that must stay solid with a single boolean
+        holes = cut_all(holes, [keep_out])
+    return cut_all(part, [holes])
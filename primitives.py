@@ -0,0 +1,101 @@
+import cadquery as cq
+from math import tan, radians
+
+from booleans import cut_all
+from patterns import circular_pattern
+from part_cache import cached_shape
+import quality
+
+#Building blocks shared by many parts (lock nubs, lock cutouts, hose barbs, port tubes)
+#Each is built at the origin from the dimensions that define it and cached like a part (see
+#part_cache.cached_shape), so a distinct nub or lock is built once and every later part, floor or
+#sweep variant only places a moved copy of it
+#  nub = primitives.lock_nub(self.lock_nub_diam, self.lock_nub_diam/2).translate((0, r, z))
+#  locks = circular_pattern(primitives.lock_cutout("XZ", 14, 24, 5, 5.5, 4.5, -40), self.n_locks)
+
+@cached_shape
+def lock_nub(diam, length):
+    #Round nub along -Y (+Y for a negative length) with a rounded tip
+    nub = cq.Workplane("XZ").circle(diam/2).extrude(length)
+    if not quality.preview():
+        nub = nub.faces("<Y" if length > 0 else ">Y").fillet(diam/4)
+    return nub
+
+def lock_sketch(lock_h, h_track_w, h_track_h, v_track_w, v_track_h, h_slanted=1, v_slant_angle=45):
+    #Sketch starts in top left corner of lock
+    #Lock shape (like a sideways tetris Z)
+    if h_slanted:
+        h_slant_dist = 1.5
+        lock = cq.Sketch().polygon([
+                [0,0],
+                [v_track_w+2,0],
+                [v_track_w+2+(v_track_h+0.25)/tan(radians(v_slant_angle)), -v_track_h-0.25],
+                [h_track_w,-h_slant_dist], #Adds slant
+                [h_track_w, -lock_h],
+                [h_track_w-v_track_w, -lock_h],
+                [h_track_w-v_track_w, -lock_h+v_track_h+0.25],
+                [(lock_h-h_slant_dist)/tan(radians(v_slant_angle)),-lock_h+h_slant_dist], #Adds slant
+                [0,0]
+            ])
+        return lock if quality.preview() else lock.vertices().fillet(0.5)
+    else:
+        return cq.Sketch().polygon([
+            [0,0],
+            [v_track_w,0],
+            [v_track_w, -v_track_h],
+            [h_track_w,-v_track_h],
+            [h_track_w, -lock_h],
+            [h_track_w-v_track_w, -lock_h],
+            [h_track_w-v_track_w, -lock_h+v_track_h],
+            [0,-lock_h+v_track_h],
+            [0,0]
+        ])
+
+@cached_shape
+def lock_cutout(plane, lock_h, h_track_w, h_track_h, v_track_w, v_track_h, depth, h_slanted=1, v_slant_angle=45):
+    #Lock sketch extruded depth from the named plane
+    sketch = lock_sketch(lock_h, h_track_w, h_track_h, v_track_w, v_track_h, h_slanted, v_slant_angle)
+    return cq.Workplane(plane).placeSketch(sketch).extrude(depth)
+
+@cached_shape
+def barb(inner_r, outer_r, h):
+    #Hose barb ring around Z, widening from inner_r at the bottom to outer_r at h
+    barb_sketch = (
+        cq.Sketch()
+        .segment((inner_r,0), (inner_r,h))
+        .segment((inner_r,h), (outer_r, h))
+        .close()
+        .assemble()
+    )
+    return cq.Workplane("XZ").placeSketch(barb_sketch).revolve(360)
+
+@cached_shape
+def port_tube(port_diam, wall_thick, stickout, lock_h, lock_nub_diam, lock_depth, cutout_wall_thick=1.5, n_locks=2, rounded=True):
+    #Port pipe along +Y from the origin with its lock cutouts, open on both ends
+    if rounded:
+        port = cq.Workplane("XZ")\
+            .circle(port_diam/2)\
+            .circle(port_diam/2 + wall_thick)\
+            .extrude(-stickout)
+    else:
+        port = cq.Workplane("XZ")\
+            .rect(port_diam/2, port_diam/2)\
+            .rect(port_diam/2 + wall_thick, port_diam/2 + wall_thick)\
+            .extrude(-stickout)
+
+    #Create lock cutout shape for port
+    h_track_w = 12
+    h_track_h = lock_nub_diam + 1
+    v_track_w = lock_nub_diam + 1
+    v_track_h = (lock_h - h_track_h) / 2
+    lock = lock_cutout("XY", lock_h, h_track_w, h_track_h, v_track_w, v_track_h, -lock_depth, v_slant_angle=90)
+    lock = lock.translate((-h_track_w + v_track_w/2,stickout,0))
+
+    #Cut locks out of port walls
+    port = cut_all(port, [circular_pattern(lock, n_locks, start_angle=90, axis=(0,1,0))])
+
+    #Replace very outer port wall to prevent lock cutout from going all the way through
+    return port.faces("XZ").workplane()\
+        .circle(port_diam/2 + wall_thick)\
+        .circle(port_diam/2 + wall_thick-cutout_wall_thick)\
+        .extrude(-stickout)
@@ -0,0 +1,34 @@
+import os
+from contextlib import contextmanager
+
+#Global build quality level
+#In preview quality parts skip or simplify features that don't change fit or layout (fillets, chamfers,
+#threads, drain holes, air holes), so interactive iteration is fast. Final quality builds are unchanged
+#The level is kept in the environment so worker processes (parallel builds, build.py) inherit it
+#  with quality.level(quality.PREVIEW):
+#      PlantFloor().display(show_object)
+
+FINAL = "final"
+PREVIEW = "preview"
+LEVELS = (FINAL, PREVIEW)
+ENV = "CQ_HYDRO_QUALITY"
+
+def current():
+    return os.environ.get(ENV, FINAL)
+
+def preview():
+    return current() == PREVIEW
+
+def set_level(value):
+    if value not in LEVELS:
+        raise ValueError(f"unknown quality level {value!r} (expected one of {', '.join(LEVELS)})")
+    os.environ[ENV] = value
+
+@contextmanager
+def level(value):
+    previous = current()
+    set_level(value)
+    try:
+        yield
+    finally:
+        set_level(previous)
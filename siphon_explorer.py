@@ -0,0 +1,215 @@
+import argparse
+import csv
+import dataclasses
+import itertools
+import json
+import os
+import sys
+
+import numpy as np
+
+from build import parse_params, parse_range, snake_case
+from hydraulics import ML, orifice_flow
+
+#Analytic bell siphon design space explorer
+#Every combination of the varied BellSiphon fields is evaluated at once in NumPy (start/stop levels,
+#water held, fill and drain times) without building any solids; only the top ranked designs are built
+#  python siphon_explorer.py --vary siphon_r=3:6:13 --vary drain_h=14:26:13 --vary n_bell_slot=3,4,6,8 --inflow 3
+#  python siphon_explorer.py --vary snorkel=false,true --rank period_s --ascending --build 3
+
+METRICS = [
+    "trigger_h", "stop_h", "trigger_volume_ml", "cycle_volume_ml",
+    "first_fill_s", "fill_s", "drain_s", "period_s", "drain_margin",
+]
+N_X = 256 #Quadrature columns across the basin
+N_LEVELS = 64 #Water levels between stop and trigger
+MODEL_CONSTANTS = ("snorkel_opening_h", "snorkel_r") #Set by BellSiphon.calc_vars, not fields, so not variable here
+
+def part_fields(part):
+    #Field values of a BellSiphon instance, including the unannotated snorkel_angle, and the constants
+    #derived() needs from its calc_vars
+    values = {f.name: getattr(part, f.name) for f in dataclasses.fields(part)}
+    values["snorkel_angle"] = part.snorkel_angle
+    values.update({k: getattr(part, k) for k in MODEL_CONSTANTS})
+    return values
+
+def design_grid(base, vary):
+    #Dict of flat arrays, one entry per combination of the varied fields
+    names = list(vary)
+    combos = list(itertools.product(*(vary[n] for n in names)))
+    grid = {k: np.full(len(combos), v, dtype=float) for (k, v) in base.items() if isinstance(v, (bool, int, float))}
+    for (i, n) in enumerate(names):
+        grid[n] = np.array([c[i] for c in combos], dtype=float)
+    return grid
+
+def derived(d):
+    #Vectorized BellSiphon.calc_vars (keep in step with it)
+    slant = np.tan(np.radians(90-d["basin_angle"]))*d["siphon_r"]*2
+    d["siphon_slot_slanted_h"] = d["siphon_slot_h"] + slant
+    d["siphon_h"] = d["drain_h"] + d["siphon_slot_slanted_h"]
+    d["siphon_funnel_top_r"] = np.where(d["siphon_funnel"] > 0, d["siphon_r"]+2, d["siphon_r"])
+    d["bell_r"] = d["siphon_r"] * 2
+    d["bell_h"] = d["siphon_h"] - np.sqrt(np.clip(d["bell_r"]**2 - d["siphon_funnel_top_r"]**2, 0, None))
+    d["siphon_offset"] = d["basin_r"] - d["bell_r"] - d["wall_thick"]
+    d["snorkel_h"] = d["bell_slot_h"] + d["snorkel_opening_h"]
+    d["snorkel_offset"] = d["bell_r"] + d["wall_thick"] + d["snorkel_r"] - 0.5
+    return d
+
+def installed_z(d, x, z):
+    #World Z of a point in make()'s frame (before its half turn) once the basin is seated; see BellSiphon.installed_pose
+    a = np.radians(d["basin_angle"])
+    return (d["basin_r"] - x)*np.cos(a) + z*np.sin(a)
+
+def levels(d):
+    #(outlet, stop, trigger) levels, as in BellSiphon.water_levels
+    slant = np.tan(np.radians(90-d["basin_angle"]))*d["siphon_r"]*2
+    rim_z = d["drain_h"] + d["wall_thick"]
+    trigger = np.minimum(
+        installed_z(d, d["siphon_offset"]-d["siphon_r"], rim_z),
+        installed_z(d, d["siphon_offset"]+d["siphon_r"], rim_z+slant),
+    )
+    #The slot nearest the low side of the basin (largest world Z is the one furthest up the tilt)
+    n_slots = np.maximum(d["n_bell_slot"], 1)
+    max_cos = np.where(n_slots % 2 == 0, 1, np.cos(np.pi/n_slots))
+    slot_stop = installed_z(d, d["siphon_offset"]-d["bell_r"]*max_cos, d["bell_slot_h"])
+    snorkel_x = d["siphon_offset"] - d["snorkel_offset"]*np.sin(np.radians(d["snorkel_angle"]))
+    snorkel_stop = installed_z(d, snorkel_x, d["snorkel_h"])
+    stop = np.where(d["snorkel"] > 0, snorkel_stop, slot_stop)
+    return (installed_z(d, d["siphon_offset"], 0), stop, trigger)
+
+def chord(r, x):
+    #Width of a circle of radius r (centred on x=0) at each x
+    return 2*np.sqrt(np.clip(r**2 - x**2, 0, None))
+
+def volume_below(d, heights):
+    #Water held (mm^3) at heights (designs, levels), integrating over columns along the basin axis
+    #Columns: basin interior, minus the siphon tube and the bell wall up to the siphon top
+    inner_r = (d["basin_r"] - d["wall_thick"])[:, None]
+    t = (np.arange(N_X) + 0.5) / N_X * 2 - 1
+    x = inner_r * t #(designs, columns)
+    dx = 2 * inner_r / N_X
+    sx = x - d["siphon_offset"][:, None]
+    basin_w = np.where(d["round_basin"][:, None] > 0, chord(inner_r, x), 2*inner_r)
+    bell_r = d["bell_r"][:, None]
+    solid_w = chord(d["siphon_r"][:, None], sx) + chord(bell_r + d["wall_thick"][:, None], sx) - chord(bell_r, sx)
+    a = np.radians(d["basin_angle"])[:, None, None]
+    #Local Z of the waterline over each column
+    z_water = (heights[:, :, None] - (d["basin_r"][:, None, None] - x[:, None, :])*np.cos(a)) / np.sin(a)
+    floor = d["wall_thick"][:, None, None]
+    wet = np.clip(z_water - floor, 0, (d["basin_h"][:, None, None] - floor))
+    wet_solid = np.clip(z_water - floor, 0, (d["siphon_h"][:, None, None] - floor))
+    return ((basin_w[:, None, :]*wet - solid_w[:, None, :]*wet_solid) * dx[:, :, None]).sum(axis=2)
+
+def evaluate(d, inflow, outlet_drop=0, cd=0.6, chunk=512):
+    #Metrics for every design; designs are processed in chunks to bound memory
+    d = derived(d)
+    n = len(d["siphon_r"])
+    out = {m: np.empty(n) for m in METRICS}
+    (outlet, stop, trigger) = levels(d)
+    out["trigger_h"] = trigger
+    out["stop_h"] = stop
+    bore_area = np.pi * (d["siphon_r"] - d["wall_thick"])**2
+    for i in range(0, n, chunk):
+        s = slice(i, i+chunk)
+        part = {k: v[s] for (k, v) in d.items()}
+        hs = np.linspace(stop[s], trigger[s], N_LEVELS, axis=1)
+        volumes = volume_below(part, np.concatenate([outlet[s, None], hs], axis=1)) / ML
+        (start_v, volumes) = (volumes[:, 0], volumes[:, 1:])
+        mid = (hs[:, 1:] + hs[:, :-1]) / 2
+        net = orifice_flow(bore_area[s, None], mid - outlet[s, None] + outlet_drop, cd) / ML - inflow
+        with np.errstate(divide="ignore", invalid="ignore"):
+            drain_s = np.where(np.all(net > 0, axis=1), np.sum(np.diff(volumes, axis=1) / net, axis=1), np.inf)
+        out["trigger_volume_ml"][s] = volumes[:, -1]
+        out["cycle_volume_ml"][s] = volumes[:, -1] - volumes[:, 0]
+        out["first_fill_s"][s] = (volumes[:, -1] - start_v) / inflow
+        out["fill_s"][s] = out["cycle_volume_ml"][s] / inflow
+        out["drain_s"][s] = drain_s
+        out["drain_margin"][s] = net.min(axis=1) / inflow #Spare drain capacity at the weakest point, x inflow
+    out["period_s"] = out["fill_s"] + out["drain_s"]
+    #Designs that can't be built or never cycle
+    fits = (d["bell_r"] + 1.5*d["wall_thick"] <= d["basin_r"]) & (d["siphon_h"] + d["bell_r"] + d["wall_thick"] <= d["basin_h"])
+    fits &= d["siphon_r"] > d["wall_thick"]
+    out["valid"] = fits & (stop < trigger) & np.isfinite(out["drain_s"])
+    return out
+
+def ranked(d, out, rank, ascending):
+    order = np.argsort(out[rank] if ascending else -out[rank], kind="stable")
+    return [i for i in order if out["valid"][i]]
+
+def row(d, out, vary, i):
+    r = {n: _plain(d[n][i], vary[n]) for n in vary}
+    r.update({m: float(out[m][i]) for m in METRICS})
+    return r
+
+def _plain(value, choices):
+    #Back to the type the field was given as (bools and ints survive the float grid)
+    sample = choices[0]
+    if isinstance(sample, bool):
+        return bool(value)
+    if isinstance(sample, int):
+        return int(value)
+    return round(float(value), 4)
+
+def print_table(rows, vary):
+    cols = list(vary) + ["trigger_h", "stop_h", "cycle_volume_ml", "fill_s", "drain_s", "period_s", "drain_margin"]
+    print("".join(f"{c:>16}" for c in ["rank"] + cols))
+    for (n, r) in enumerate(rows, 1):
+        print(f"{n:>16}" + "".join(f"{r[c]:>16.4g}" if isinstance(r[c], float) else f"{r[c]!s:>16}" for c in cols))
+
+def build_top(rows, base_params, vary, out_dir):
+    #Only the shortlisted designs ever become solids
+    from bell_siphon import BellSiphon
+    from part_cache import build_many
+    from exports import atomic_export
+    os.makedirs(out_dir, exist_ok=True)
+    parts = [BellSiphon(**base_params, **{n: r[n] for n in vary}) for r in rows]
+    paths = []
+    for (n, body) in enumerate(build_many(parts), 1):
+        paths.append(atomic_export(body, os.path.join(out_dir, f"{snake_case('BellSiphon')}_rank{n}.stl")))
+    return paths
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rank BellSiphon designs with an analytic hydraulic model")
+    parser.add_argument("--vary", action="append", metavar="FIELD=RANGE", default=[], help="start:stop:num or a comma separated list")
+    parser.add_argument("--set", action="append", metavar="FIELD=VALUE", help="Override a fixed field (JSON value)")
+    parser.add_argument("--inflow", type=float, default=2, help="Pump inflow, mL/s")
+    parser.add_argument("--outlet-drop", type=float, default=0, help="Fall of the discharge below the basin, mm")
+    parser.add_argument("--rank", default="cycle_volume_ml", choices=METRICS)
+    parser.add_argument("--ascending", action="store_true", help="Rank smallest first")
+    parser.add_argument("--top", type=int, default=20, help="Rows shown")
+    parser.add_argument("--build", type=int, default=0, metavar="N", help="Build and export the top N designs")
+    parser.add_argument("-o", "--out-dir", default=os.path.join("stl", "siphon_explorer"))
+    parser.add_argument("--csv", help="Write every valid design, ranked, to this file")
+    parser.add_argument("--json", help="Write every valid design, ranked, to this file")
+    args = parser.parse_args(argv)
+
+    from bell_siphon import BellSiphon
+    defaults = part_fields(BellSiphon())
+    fixed = parse_params(args.set, parser)
+    vary = {k: parse_range(v) for (k, v) in (a.split("=", 1) for a in args.vary)}
+    unknown = [k for k in list(vary) + list(fixed) if k not in defaults or k in MODEL_CONSTANTS]
+    if unknown:
+        parser.error(f"unknown BellSiphon field(s): {', '.join(unknown)}")
+
+    d = design_grid({**defaults, **fixed}, vary)
+    out = evaluate(d, args.inflow, args.outlet_drop)
+    order = ranked(d, out, args.rank, args.ascending)
+    rows = [row(d, out, vary, i) for i in order]
+    print(f"{len(d['siphon_r'])} designs, {len(rows)} valid (prime, fit and break at {args.inflow:g} mL/s)")
+    print_table(rows[:args.top], vary)
+
+    if args.csv and rows:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"inflow": args.inflow, "fixed": fixed, "designs": rows}, f, indent=1)
+    if args.build:
+        for path in build_top(rows[:args.build], fixed, vary, args.out_dir):
+            print(path)
+    return 0 if rows else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
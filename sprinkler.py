@@ -6,6 +6,9 @@ import sys
 sys.path.append("../cq_style")
 from cq_style import StylishPart
 from tube_adaptor import TubeAdaptor
+from part_cache import cached_make
+from booleans import cut_all
+from patterns import circular_pattern
 
 @dataclass
 class Sprinkler(StylishPart):
@@ -25,6 +28,7 @@ class Sprinkler(StylishPart):
         self.wall_thick = self.fdm_extrude_w * 4
         self.sprinkler_top_r = self.sprinkler_bot_r * 0.65
 
+    @cached_make
     def make(self):
         adaptor = TubeAdaptor()
 
@@ -43,13 +47,15 @@ class Sprinkler(StylishPart):
         )
         slot_angle = (360 - self.slot_spacer_angle*self.n_slots) / self.n_slots
         row_offset = self.sprinkler_h / (self.n_rows + 1)
+        slots = []
         for i in range(self.n_rows):
-            for j in range(self.n_slots):
-                sprinkler = sprinkler.cut(
-                    sprinkler.copyWorkplane(Workplane("XZ")).moveTo(0, (i+1)*row_offset)
-                    .rect(2*self.sprinkler_bot_r, self.slot_h, centered=[0,1]).revolve(slot_angle, combine=False)
-                    .rotate((0,0,0), (0,0,1),j*(slot_angle+self.slot_spacer_angle)+i*((slot_angle+self.slot_spacer_angle)/2))
-                )
+            slot = (
+                sprinkler.copyWorkplane(Workplane("XZ")).moveTo(0, (i+1)*row_offset)
+                .rect(2*self.sprinkler_bot_r, self.slot_h, centered=[0,1]).revolve(slot_angle, combine=False)
+            )
+            #Stagger alternating rows by half a slot pitch
+            slots.append(circular_pattern(slot, self.n_slots, start_angle=i*((slot_angle+self.slot_spacer_angle)/2)))
+        sprinkler = cut_all(sprinkler, slots)
 
         sprinkler = (
             sprinkler.copyWorkplane(Workplane("XY"))
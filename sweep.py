@@ -0,0 +1,211 @@
+import argparse
+import csv
+import dataclasses
+import importlib
+import itertools
+import json
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+from build import discover, parse_params, parse_range, set_booleans, snake_case
+
+#Parameter sweeps: builds every combination of the varied fields of a part in a process pool
+#Variants that come out identical (same part_cache.cache_key) are built once, and a manifest with
+#timing and mass properties of every variant is kept up to date as builds finish, so a long sweep
+#can be stopped and picked up again with --resume
+#  python sweep.py PlantFloor --vary tower_od=70,80,90 --vary port_angle=35:50:4 -j 8
+#  python sweep.py PlantFloor --from Floor --vary lock_nub_diam=3.5:4.5:3 --vary n_locks=2,3,4
+#  python sweep.py CrownFloor.sieve --call mini_sieve=true --vary tower_od=70:90:5
+
+DENSITY = 1.24 #g/cm^3, PLA
+
+def coerce(cls, name, value):
+    #Keeps int fields int when a numeric range produced floats
+    field = next((f for f in dataclasses.fields(cls) if f.name == name), None)
+    if field is not None and isinstance(field.default, int) and not isinstance(field.default, bool) and float(value).is_integer():
+        return int(value)
+    return value
+
+def make_variant(cls, params, base_cls=None, method=None, call=None):
+    #base_cls: params that are fields of it build a base instance the part is derived from (cls.from_instance)
+    #method: name of a method of the part returning the part to build (eg. CrownFloor.sieve)
+    if base_cls is None:
+        part = cls(**params)
+    else:
+        base_fields = {f.name for f in dataclasses.fields(base_cls)}
+        part = cls.from_instance(base_cls(**{k: v for (k, v) in params.items() if k in base_fields}))
+        for (k, v) in params.items():
+            if k not in base_fields:
+                setattr(part, k, v)
+        part.calc_vars()
+    if method:
+        part = getattr(part, method)(**(call or {}))
+    return part
+
+def build_variant(spec, params, out_dir, fmt, density):
+    #Runs in a worker process; spec is (module, class, base module, base class, method, call kwargs)
+    (module, name, base_module, base_name, method, call) = spec
+    import cadquery as cq
+    from exports import atomic_export
+    from meshing import part_tolerance
+    from part_cache import cache_key, to_shape, memory_mb
+    cls = getattr(importlib.import_module(module), name)
+    base_cls = getattr(importlib.import_module(base_module), base_name) if base_name else None
+    part = make_variant(cls, params, base_cls, method, call)
+
+    t_start = time.perf_counter()
+    result = part.part()
+    build_s = time.perf_counter() - t_start
+
+    ext = fmt
+    if ext == "auto":
+        ext = "step" if isinstance(result, cq.Assembly) else "stl"
+    path = os.path.join(out_dir, f"{snake_case(type(part).__name__)}_{cache_key(part)[:12]}.{ext}")
+    t_start = time.perf_counter()
+    atomic_export(result, path, tolerance=part_tolerance(part))
+    export_s = time.perf_counter() - t_start
+
+    shape = to_shape(result.toCompound() if isinstance(result, cq.Assembly) else result)
+    bb = shape.BoundingBox()
+    volume = shape.Volume()
+    return {
+        "output": path,
+        "build_s": build_s,
+        "export_s": export_s,
+        "volume_mm3": volume,
+        "mass_g": volume / 1000 * density,
+        "center_of_mass": list(shape.Center().toTuple()),
+        "bbox_mm": [bb.xlen, bb.ylen, bb.zlen],
+        "rss_mb": memory_mb(),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def save_manifest(path, manifest):
+    #Written next to its destination and renamed into place, so an interrupted sweep leaves a readable manifest
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, path)
+
+def save_csv(path, rows):
+    params = sorted({k for r in rows for k in r["params"]})
+    cols = ["variant", "key", "status", "output", "build_s", "export_s", "volume_mm3", "mass_g", "rss_mb", "peak_rss_mb", "error"]
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(params + cols + ["com_x", "com_y", "com_z", "bbox_x", "bbox_y", "bbox_z"])
+        for r in rows:
+            writer.writerow(
+                [r["params"].get(p, "") for p in params] + [r.get(c, "") for c in cols]
+                + (r.get("center_of_mass") or [""]*3) + (r.get("bbox_mm") or [""]*3)
+            )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build every combination of a cq_hydro part's parameters")
+    parser.add_argument("part", help="Part class name, or Class.method for parts derived by a method (eg. CrownFloor.sieve)")
+    parser.add_argument("--vary", action="append", metavar="FIELD=RANGE", default=[], help="start:stop:num or a comma separated list")
+    parser.add_argument("--set", action="append", metavar="FIELD=VALUE", help="Fixed field value (JSON value)")
+    parser.add_argument("--from", dest="base", metavar="CLASS", help="Derive each variant with from_instance from this base part class")
+    parser.add_argument("--call", action="append", metavar="ARG=VALUE", help="Keyword argument for the Class.method call")
+    parser.add_argument("-o", "--out-dir", help="Output directory (default: stl/sweep_<part>)")
+    parser.add_argument("-f", "--format", default="auto", choices=["auto", "stl", "step"])
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Variants built concurrently")
+    parser.add_argument("--recycle", type=int, default=10, help="Builds per worker process before it is replaced (bounds memory)")
+    parser.add_argument("--density", type=float, default=DENSITY, help="Material density for mass, g/cm^3")
+    parser.add_argument("--resume", action="store_true", help="Skip variants already built by a previous run of this sweep")
+    parser.add_argument("-q", "--quality", default="final", choices=["final", "preview"], help="Build quality (preview skips cosmetic features)")
+    parser.add_argument("--compact", action="store_true", help="Keep only final solids in the workers, not build history")
+    parser.add_argument("--booleans", metavar="NAME=VALUE,...", help="OCCT boolean settings: parallel, fuzzy, obb (see boolean_options.py)")
+    parser.add_argument("--dry-run", action="store_true", help="List the unique variants without building")
+    args = parser.parse_args(argv)
+
+    #Set in the environment so worker processes build at the same quality
+    os.environ["CQ_HYDRO_QUALITY"] = args.quality
+    if args.compact:
+        os.environ["CQ_HYDRO_COMPACT"] = "1"
+    if args.booleans is not None:
+        set_booleans(parser, args.booleans)
+
+    (name, _, method) = args.part.partition(".")
+    parts = discover()
+    if name not in parts:
+        parser.error(f"unknown part: {name}")
+    cls = parts[name]
+    #Base classes needn't be buildable themselves (eg. Floor), so also look in the part's module
+    base_cls = (parts.get(args.base) or getattr(sys.modules[cls.__module__], args.base, None)) if args.base else None
+    if args.base and not (isinstance(base_cls, type) and dataclasses.is_dataclass(base_cls)):
+        parser.error(f"unknown base part: {args.base}")
+    if method and not callable(getattr(cls, method, None)):
+        parser.error(f"{name} has no method {method}")
+    spec = (cls.__module__, name, base_cls.__module__ if base_cls else None, args.base, method or None, parse_params(args.call, parser, "--call"))
+
+    fixed = parse_params(args.set, parser)
+    vary = {k: parse_range(v) for (k, v) in (a.split("=", 1) for a in args.vary)}
+    fields = {f.name for f in dataclasses.fields(cls)} | ({f.name for f in dataclasses.fields(base_cls)} if base_cls else set())
+    unknown = [k for k in list(vary) + list(fixed) if k not in fields]
+    if unknown:
+        parser.error(f"unknown {name} field(s): {', '.join(unknown)}")
+
+    out_dir = args.out_dir or os.path.join("stl", f"sweep_{snake_case(name)}{'_' + method if method else ''}")
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, "manifest.json")
+
+    from part_cache import cache_key
+    import boolean_options
+    rows = []
+    unique = {}
+    for combo in itertools.product(*vary.values()):
+        params = {**fixed, **{k: coerce(cls, k, v) for (k, v) in zip(vary, combo)}}
+        key = cache_key(make_variant(cls, params, base_cls, method, spec[5]))
+        rows.append({"variant": len(rows), "params": params, "key": key, "status": "pending"})
+        unique.setdefault(key, rows[-1])
+    print(f"{len(rows)} variants, {len(unique)} unique")
+    if args.dry_run:
+        for r in unique.values():
+            print(r["key"][:12], json.dumps(r["params"]))
+        return 0
+
+    done = {}
+    if args.resume and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            for r in json.load(f)["variants"]:
+                if r["status"] == "built" and os.path.exists(r["output"]):
+                    done[r["key"]] = r
+
+    manifest = {"part": args.part, "base": args.base, "call": spec[5], "quality": args.quality, "booleans": boolean_options.current(), "variants": rows}
+    def record(key, result):
+        for r in rows:
+            if r["key"] == key:
+                r.update({k: v for (k, v) in result.items() if k not in ("variant", "params", "key")})
+                r["status"] = ("built" if r is unique[key] else "duplicate") if "error" not in result else "failed"
+        save_manifest(manifest_path, manifest)
+
+    t_start = time.perf_counter()
+    todo = [(k, r) for (k, r) in unique.items() if k not in done]
+    for (key, r) in done.items():
+        if key in unique:
+            record(key, r)
+    with ProcessPoolExecutor(max_workers=args.jobs, mp_context=get_context("spawn"), max_tasks_per_child=args.recycle) as pool:
+        futures = {pool.submit(build_variant, spec, r["params"], out_dir, args.format, args.density): key for (key, r) in todo}
+        for (n, future) in enumerate(as_completed(futures), 1):
+            key = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"error": f"{type(e).__name__}: {e}"}
+            record(key, result)
+            status = result.get("error") or f"{result['build_s']:.1f} s  {result['mass_g']:.1f} g  {result['output']}"
+            print(f"[{n}/{len(todo)}] {json.dumps(unique[key]['params'])}  {status}", flush=True)
+
+    manifest["total_s"] = time.perf_counter() - t_start
+    save_manifest(manifest_path, manifest)
+    save_csv(os.path.join(out_dir, "manifest.csv"), rows)
+    failed = sum(r["status"] == "failed" for r in rows)
+    print(f"{len(todo)} built in {manifest['total_s']:.0f} s, {len(done)} reused, {failed} failed; manifest in {manifest_path}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,13 @@
 import cadquery as cq
 from tower_floor import Floor, PlantFloor, CrownFloor, MasonFloor, LidFloor
 from collections import namedtuple
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import cq_warehouse.extensions
 from sprinkler import Sprinkler
+from part_cache import build_many, cache_key, compact, compact_results
+import exports
+from meshing import part_tolerance
+from typing import Any
 
 import sys
 sys.path.append("../cq_style")
@@ -11,6 +15,23 @@ from cq_style import StylishPart
 
 base_floor = Floor()
 
+def split_assembly(a):
+    #Copy of an assembly with everything on the +X side cut away, to show the inside of the tower
+    size = a.toCompound().BoundingBox().DiagonalLength
+    half = cq.Solid.makeBox(size, 2*size, 2*size, pnt=cq.Vector(0, -size, -size))
+    split = cq.Assembly()
+    def add(node, parent_loc):
+        loc = parent_loc * node.loc
+        for shape in node.shapes:
+            split.add(shape.moved(loc).cut(half), color=node.color)
+        for child in node.children:
+            add(child, loc)
+    add(a, cq.Location())
+    return split
+
+def floor_key(floor):
+    #Floors with identical build parameters (see part_cache.cache_key) share one built body
+    return cache_key(floor) if hasattr(floor, "part") else id(floor)
 
 @dataclass
 class AssembleFloor:
@@ -19,28 +40,50 @@ class AssembleFloor:
     z_rot: float = 0 #Rotate around z axis
     z_offset: float = 0 #Offset in tower on Z-dir
     stl: str = "" #.stl File path if export desired
+    body: Any = None #Prebuilt solid for floor (eg. from a parallel build)
 
 @dataclass
 class Tower(StylishPart):
     show_tube: bool = True
     tube_od: float = 12
     tube_id: float = 10
+    parallel: bool = False #Build each floor in its own worker process
+    max_workers: int = 0 #Worker processes for parallel builds (0 = one per CPU)
+    compact: bool = field(default_factory=compact_results) #Keep only each floor's final solid in the assembly, not its build history (default: CQ_HYDRO_COMPACT)
+    export_floors: bool = False #Queue each floor's STL export (see AssembleFloor.stl) while assembling
     def assemble_tower(self, floors, explode_h=0):
         current_h = 0
         a = cq.Assembly()
+        #Each unique floor is built once and referenced from every Location it appears at,
+        #so duplicates also share a single shape in STEP exports
+        bodies = {}
         for (i, f) in enumerate(floors):
             floor = f.floor
-            floor_body = floor.part() if hasattr(floor, "part") else floor
+            key = floor_key(floor)
+            if key not in bodies:
+                if f.body is not None:
+                    bodies[key] = f.body
+                else:
+                    bodies[key] = floor.part() if hasattr(floor, "part") else floor
+                if self.compact:
+                    bodies[key] = compact(bodies[key])
+            floor_body = bodies[key]
+            floor_loc = cq.Location(cq.Vector(0, 0, current_h+f.z_offset), cq.Vector(0, 0, 1), f.z_rot)
             a = a.add(
                 floor_body,
-                loc=cq.Location(cq.Vector(0, 0, current_h+f.z_offset), cq.Vector(0, 0, 1), f.z_rot),
+                loc=floor_loc,
                 color= f.color
             )
+            #Preview-only parts (eg. netcups in ports) are placed as instances, not fused into the floor
+            if hasattr(floor, "preview_parts"):
+                for (body, loc) in floor.preview_parts():
+                    a = a.add(body, loc=floor_loc * loc, color=f.color)
             current_h += floor.floor_h+explode_h if hasattr(floor, "floor_h") and floor.floor_h > 0 else 0
             #current_h += explode_h+f.z_offset
             
-            if(f.stl != ""):
-                cq.exporters.export(floor_body, f.stl)
+            if self.export_floors and f.stl != "":
+                #Tessellated and written in the background while the rest of the tower assembles
+                exports.submit(floor_body, f.stl, tolerance=part_tolerance(floor))
         if self.show_tube:
             tube = (
                 cq.Workplane("XY")
@@ -50,7 +93,8 @@ class Tower(StylishPart):
             )
             a = a.add(tube, color=cq.Color(0.9, 0.9, 0.9, 0.5))
         return a
-    def make(self):
+    def floors(self):
+        #Floors of the default tower, bottom to top
         alpha=0.85
 
         mf = MasonFloor.from_instance(base_floor)
@@ -63,18 +107,38 @@ class Tower(StylishPart):
         sprinkler = Sprinkler()
         lf = LidFloor.from_instance(base_floor)
 
-        tower = self.assemble_tower([
+        floors = [
             AssembleFloor(mf, color=cq.Color(1,1,0,alpha), stl="stl/mason_floor.stl"),
             AssembleFloor(pf1, color=cq.Color(0,1,0,alpha), stl="stl/plant_floor.stl", z_rot=180),
             AssembleFloor(mini_sieve, color=cq.Color(1,0.5,1,alpha), z_offset=3-mini_sieve.sieve_h, stl="stl/mini_sieve.stl"),
             AssembleFloor(pf2, color=cq.Color(0,0,1,alpha)),
             AssembleFloor(sieve, color=cq.Color(0.2,0.2,0.6,alpha), z_offset=0, stl="stl/sieve.stl"),
-            AssembleFloor(sprinkler.part(), color=cq.Color(0.6,0.2,0.6,alpha), z_offset=15, stl="stl/sprinkler.stl"),
+            AssembleFloor(sprinkler, color=cq.Color(0.6,0.2,0.6,alpha), z_offset=15, stl="stl/sprinkler.stl"),
             AssembleFloor(cf, color=cq.Color(0,1,1,alpha), stl="stl/crown_floor.stl", z_rot=180),
             AssembleFloor(lf, color=cq.Color(0.5,0,1,alpha), stl="stl/lid.stl")
-        ], explode_h=0)
+        ]
+        return floors
+
+    def make(self):
+        floors = self.floors()
+        if self.parallel:
+            #Floors don't depend on each other's geometry, so build every unique floor at once
+            unique = {}
+            for f in floors:
+                unique.setdefault(floor_key(f.floor), f.floor)
+            bodies = dict(zip(unique, build_many(list(unique.values()), max_workers=self.max_workers or None)))
+            for f in floors:
+                f.body = bodies[floor_key(f.floor)]
+        tower = self.assemble_tower(floors, explode_h=0)
         return tower
 
-Tower().display_split(show_object).export("stl/tower.step").export_split("stl/tower_split.step")
+if "show_object" in locals():
+    #Built once; the view and both STEP files come from the same assembly, and the files are written
+    #in the background through the export manifest, so an unchanged tower rewrites neither
+    tower = Tower(export_floors=True).part()
+    tower_split = split_assembly(tower)
+    show_object(tower_split)
+    exports.submit(tower, "stl/tower.step")
+    exports.submit(tower_split, "stl/tower_split.step")
 #show_object(Tower().part().section(cq.Plane.named("XZ")))
 #show_object(cq.Workplane("XY").add(Tower().part().toCompound()).cut(cq.Workplane("XY").box(200,200,200, centered=[0,1,1])))
@@ -6,6 +6,12 @@ from cadquery.selectors import *
 from locking_netcup import LockingNetcup
 from mason_thread import MasonThread
 from bell_siphon import BellSiphon
+from part_cache import cached_make
+from booleans import fuse_all, cut_all
+from patterns import circular_pattern, rotation
+from perforation import polar_points, flat_locations, hole, perforate
+import primitives
+import quality
 from typing import Any
 
 import sys
@@ -21,6 +27,8 @@ class Floor(StylishPart):
     joint_h: float = 14
     n_locks: int = 3
     lock_nub_diam: float = 4
+    revolve_base: bool = False #Build the axisymmetric body by revolving one half-profile instead of unioning extrusions
+    mesh_tolerance = 0.05 #mm; floors are large and have no fine features, so their STLs stay small (see meshing.py)
 
     def calc_vars(self):
         self.tower_id = self.tower_od - 2*self.wall_thick
@@ -29,44 +37,12 @@ class Floor(StylishPart):
         self.lip_id = self.lip_od - 2*self.lip_thick
 
     def lock_nubs(self, floor):
-        nub = cq.Workplane("XZ").circle(self.lock_nub_diam/2).extrude(self.lock_nub_diam/2)
-        nub = nub.faces("<Y").fillet(self.lock_nub_diam/4)
+        nub = primitives.lock_nub(self.lock_nub_diam, self.lock_nub_diam/2)
         nub = nub.translate((0,self.tower_id/2,self.floor_h-self.lock_nub_diam/2 - 1))
 
         #Revolve around center
-        for i in range(self.n_locks):
-            offset_angle = (i * 360 / self.n_locks) + (180 / self.n_locks)
-            floor = floor.union(nub.rotate((0,0,0), (0,0,1), offset_angle))
-        return floor
-
-    def lock_cutout_sketch(self, lock_h, h_track_w, h_track_h, v_track_w, v_track_h, h_slanted=1, v_slant_angle = 45):
-        #Sketch starts in top left corner of lock
-        #Lock shape (like a sideways tetris Z)
-        if h_slanted:
-            h_slant_dist = 1.5
-            return cq.Sketch().polygon([
-                    [0,0],
-                    [v_track_w+2,0],
-                    [v_track_w+2+(v_track_h+0.25)/tan(radians(v_slant_angle)), -v_track_h-0.25],
-                    [h_track_w,-h_slant_dist], #Adds slant
-                    [h_track_w, -lock_h],
-                    [h_track_w-v_track_w, -lock_h],
-                    [h_track_w-v_track_w, -lock_h+v_track_h+0.25],
-                    [(lock_h-h_slant_dist)/tan(radians(v_slant_angle)),-lock_h+h_slant_dist], #Adds slant
-                    [0,0]
-                ]).vertices().fillet(0.5)
-        else:
-            return cq.Sketch().polygon([
-                [0,0],
-                [v_track_w,0],
-                [v_track_w, -v_track_h],
-                [h_track_w,-v_track_h],
-                [h_track_w, -lock_h],
-                [h_track_w-v_track_w, -lock_h],
-                [h_track_w-v_track_w, -lock_h+v_track_h],
-                [0,-lock_h+v_track_h],
-                [0,0]
-            ])
+        nubs = circular_pattern(nub, self.n_locks, start_angle=180 / self.n_locks)
+        return fuse_all(floor, [nubs])
 
     def lock_cutout(self, floor):
         lock_h = self.joint_h
@@ -76,34 +52,53 @@ class Floor(StylishPart):
         v_track_h = (lock_h - h_track_h) / 2
 
         #Lock shape (like a sideways tetris Z)
-        lock = (
-            cq.Workplane("XZ")
-            .placeSketch(self.lock_cutout_sketch(lock_h, h_track_w, h_track_h, v_track_w, v_track_h))
-            .extrude(-self.tower_od/2)
-        )
+        lock = primitives.lock_cutout("XZ", lock_h, h_track_w, h_track_h, v_track_w, v_track_h, -self.tower_od/2)
         #Align with top of floor
         #Also align horizontally so locking nub sits aligned with the tower when seated
         lock = lock.translate((-v_track_w/2,0,-0.5))
 
         #Revolve around center
-        for i in range(self.n_locks):
-            offset_angle = i * 360 / self.n_locks 
-            lock = lock.union(lock.rotate((0,0,0), (0,0,1), offset_angle))
+        locks = circular_pattern(lock, self.n_locks)
         
         #Create a thin inner wall to support the lock
         lock_outer_wall_replace = floor.faces("<Z").workplane().circle(self.lip_id/2-1.5).circle(self.lip_id/2 + 0.6).extrude(-self.joint_h, combine=0)
-        floor = floor.cut(lock).union(lock_outer_wall_replace)
+        floor = cut_all(floor, [locks]).union(lock_outer_wall_replace)
 
         return floor
 
+    def base_profile(self):
+        #Half-profile of the axisymmetric body as (radius, z) polygons: tube, lip bridge and inner lip
+        bridge_ir = self.lip_id/2-1.5
+        bridge_chamfer = 0 if quality.preview() else (self.tower_od-self.lip_id-1.5)/4 - 0.4
+        return [
+            [(self.tower_od/2-self.wall_thick, 0), (self.tower_od/2, 0), (self.tower_od/2, self.floor_h), (self.tower_od/2-self.wall_thick, self.floor_h)],
+            [
+                (bridge_ir, -0.5), (self.tower_od/2, -0.5),
+                (self.tower_od/2, 2.5-bridge_chamfer), (self.tower_od/2-bridge_chamfer, 2.5),
+                (bridge_ir+bridge_chamfer, 2.5), (bridge_ir, 2.5-bridge_chamfer),
+            ] if bridge_chamfer else [(bridge_ir, -0.5), (self.tower_od/2, -0.5), (self.tower_od/2, 2.5), (bridge_ir, 2.5)],
+            [(self.lip_id/2, -self.lip_h), (self.lip_od/2, -self.lip_h), (self.lip_od/2, 0), (self.lip_id/2, 0)],
+        ]
+
+    def revolve_profile(self, polygons):
+        #Polygons are fused in 2D (cheap) and the result revolved once around Z
+        sketch = cq.Sketch()
+        for p in polygons:
+            sketch = sketch.polygon(p + [p[0]], mode="a")
+        return cq.Workplane("XZ").placeSketch(sketch.clean()).revolve(360)
+
     def make_base(self, add_lock_nubs=1, add_lock_cutout=1):
-        #Make main body
-        f = cq.Workplane("XY").circle(self.tower_od/2).circle(self.tower_od/2-self.wall_thick).extrude(self.floor_h)
-        #Make inner lip for joint with section below
-        lip_bridge = f.faces("<Z").workplane(offset=-2.5).circle(self.tower_od/2).circle(self.lip_id/2-1.5).extrude(3, combine=0)
-        lip_bridge = lip_bridge.faces(">Z").chamfer((self.tower_od-self.lip_id-1.5)/4 - 0.4)
-        inner_lip = f.faces("<Z").workplane().circle(self.lip_od/2).circle(self.lip_id/2).extrude(self.lip_h,combine=0)
-        f = f.union(inner_lip).union(lip_bridge)
+        if self.revolve_base:
+            f = self.revolve_profile(self.base_profile())
+        else:
+            #Make main body
+            f = cq.Workplane("XY").circle(self.tower_od/2).circle(self.tower_od/2-self.wall_thick).extrude(self.floor_h)
+            #Make inner lip for joint with section below
+            lip_bridge = f.faces("<Z").workplane(offset=-2.5).circle(self.tower_od/2).circle(self.lip_id/2-1.5).extrude(3, combine=0)
+            if not quality.preview():
+                lip_bridge = lip_bridge.faces(">Z").chamfer((self.tower_od-self.lip_id-1.5)/4 - 0.4)
+            inner_lip = f.faces("<Z").workplane().circle(self.lip_od/2).circle(self.lip_id/2).extrude(self.lip_h,combine=0)
+            f = f.union(inner_lip).union(lip_bridge)
 
         if add_lock_cutout:
             f = self.lock_cutout(f)
@@ -130,63 +125,55 @@ class PlantFloor(Floor):
         self.netcup_h: float = self.netcup.basin_h
         self.port_diam: float = (self.netcup.basin_r + 0.2) * 2 #Clearance for smooth fit
         self.netcup_lock_top_offset = self.netcup.lock_top_offset
+        #self.port_z_offset = self.floor_h / 3
+        self.port_z_offset: float = 18 #Z-distance between base of tower to base of port
+        self.port_stickout: float = 58
+        self.port_lock_h: float = 14
+
+
+    show_netcup: bool = False #Preview a netcup in each port (not part of the printable floor)
+    cache_exclude = ("show_netcup",)
+    n_ports: int = 3
+
+    def port_location(self, angle_offset=0):
+        #Places port parts angled and positioned on the outer surface of the tower
+        return (
+            rotation(angle_offset)
+            * cq.Location(cq.Vector(0, self.tower_id/2-self.port_diam/2*tan(self.port_angle*pi/180), self.port_z_offset))
+            * rotation(self.port_angle, axis=(1,0,0))
+        )
 
-
-    show_netcup: bool = False
-    def make_ports(self, floor, n_ports=3):
-        #port_z_offset = self.floor_h / 3
-        port_z_offset = 18 #Z-distance between base of tower to base of port
-        port_stickout = 58
+    def netcup_location(self, angle_offset=0):
+        #Netcup seated and locked in a port
+        seat = cq.Vector(0, self.port_stickout-self.netcup_h+self.netcup_lock_top_offset-self.port_lock_h+self.netcup.lock_nub_diam, 0)
+        return self.port_location(angle_offset) * cq.Location(seat) * rotation(-90, axis=(1,0,0)) * rotation(-90)
+
+    def preview_parts(self):
+        #(body, location) of each preview-only part; the netcup is built once and shared by every port
+        if not self.show_netcup:
+            return []
+        netcup = self.netcup.part()
+        return [(netcup, self.netcup_location(i * 360/self.n_ports)) for i in range(self.n_ports)]
+
+    def preview(self):
+        #Assembly of the printable floor with its preview parts placed as instances
+        a = cq.Assembly().add(self.part(), name="floor")
+        for (i, (body, loc)) in enumerate(self.preview_parts()):
+            a = a.add(body, loc=loc, name=f"netcup_{i}")
+        return a
+
+    def make_ports(self, floor):
+        n_ports = self.n_ports
+        port_z_offset = self.port_z_offset
+        port_stickout = self.port_stickout
         port_wall_thick = self.wall_thick + 2
         cutout_wall_thick = 1.5
         
+        def position_port_part(p):
+            return p.newObject([p.val().moved(self.port_location())])
 
-        #Places ports angled and positioned on the outer surface of the tower
-        def position_port_part(p, angle_offset=0):
-            p = p.rotate((0,0,0),(1,0,0), self.port_angle)
-            p = p.translate((0,self.tower_id/2-self.port_diam/2*tan(self.port_angle*pi/180), port_z_offset))
-            if angle_offset != 0:
-                p = p.rotate((0,0,0), (0,0,1), angle_offset)
-            return p
-            
-        rounded_port = 1
-        #Create port pipe
-        if rounded_port:
-            port = cq.Workplane("XZ")\
-                .circle(self.port_diam/2)\
-                .circle(self.port_diam/2 + port_wall_thick)\
-                .extrude(-port_stickout)
-
-        else: 
-            port = cq.Workplane("XZ")\
-                .rect(self.port_diam/2, self.port_diam/2)\
-                .rect(self.port_diam/2 + port_wall_thick, self.port_diam/2 + port_wall_thick)\
-                .extrude(-port_stickout)
-
-        #Create lock cutout shape for port
-        lock_h= 14
-        h_track_w = 12
-        h_track_h = self.lock_nub_diam + 1
-        v_track_w = self.lock_nub_diam + 1
-        v_track_h = (lock_h - h_track_h) / 2
-        lock = (
-            cq.Workplane("XY")
-            .placeSketch(self.lock_cutout_sketch(lock_h, h_track_w, h_track_h, v_track_w, v_track_h, v_slant_angle=90))
-            .extrude(-self.tower_od/2)
-            .translate((-h_track_w + v_track_w/2,port_stickout,0))
-        )
-
-        #Cut locks out of port walls
-        n_locks = 2
-        for i in range(n_locks):
-            offset_angle = i * 360 / n_locks 
-            port = port.cut(lock.rotate((0,0,0), (0,1,0), offset_angle+90))
-        
-        #Replace very outer port wall to prevent lock cutout from going all the way through
-        port = port.faces("XZ").workplane()\
-            .circle(self.port_diam/2 + port_wall_thick)\
-            .circle(self.port_diam/2 + port_wall_thick-cutout_wall_thick)\
-            .extrude(-port_stickout)
+        #Port pipe with its locks, shared by every port and every floor with the same port dimensions
+        port = primitives.port_tube(self.port_diam, port_wall_thick, port_stickout, self.port_lock_h, self.lock_nub_diam, self.tower_od/2, cutout_wall_thick)
 
         port_hole = cq.Workplane("XZ")\
             .circle(self.port_diam/2)\
@@ -195,17 +182,11 @@ class PlantFloor(Floor):
         #Clear port extrusion from inside of tower
         port_center_cutout = floor.faces(">Z").workplane().circle(self.tower_id/2).extrude(-self.floor_h)
 
-        for i in range(n_ports):
-            angle_offset = i * 360/n_ports
-
-            floor = floor.union(position_port_part(port, angle_offset).cut(port_center_cutout))
-            floor = floor.cut(position_port_part(port_hole, angle_offset))
-            if (self.show_netcup):
-                nc = self.netcup.make().rotate((0,0,0), (0,0,1), -90).rotate((0,0,0), (1,0,0), -90)
-                nc = nc.translate((0,port_stickout-self.netcup_h+self.netcup_lock_top_offset-lock_h+self.netcup.lock_nub_diam,0))
-                floor = floor.union(position_port_part(nc, angle_offset))
+        floor = fuse_all(floor, [circular_pattern(position_port_part(port).cut(port_center_cutout), n_ports)])
+        floor = cut_all(floor, [circular_pattern(position_port_part(port_hole), n_ports)])
 
         return floor
+    @cached_make
     def make(self):
         f = self.make_base()
         f = self.make_ports(f)
@@ -218,18 +199,26 @@ class CrownFloor(Floor):
     lid_h = 20
     lid_lip_h = 14
 
-    def make(self):
+    def crown_slope_profile(self):
         crown_id = self.tower_od - 25
         slope_apex = (self.tower_od - crown_id)/2*tan(radians(self.crown_angle))
+        return [
+            (self.tower_od/2, 0),
+            (crown_id/2, 0),
+            #(crown_id/2, 2),
+            (self.tower_od/2, slope_apex),
+        ]
+
+    def base_profile(self):
+        return super().base_profile() + [self.crown_slope_profile()]
+
+    @cached_make
+    def make(self):
         f = self.make_base(add_lock_nubs=0)
-        crown_slope = cq.Workplane("XZ").sketch().polygon([
-            [self.tower_od/2, 0],
-            [crown_id/2, 0],
-            #[crown_id/2, 2],
-            [self.tower_od/2, slope_apex],
-            [self.tower_od/2, 0],
-        ]).finalize().revolve(360)
-        f = f.union(crown_slope)
+        if not self.revolve_base:
+            slope = self.crown_slope_profile()
+            crown_slope = cq.Workplane("XZ").sketch().polygon(slope + [slope[0]]).finalize().revolve(360)
+            f = f.union(crown_slope)
         return f
     def sieve(self, mini_sieve: bool = False):
         cs = CrownSieve.from_instance(self)
@@ -256,6 +245,7 @@ class CrownSieve(CrownFloor):
         self.sieve_h = (self.sieve_od - self.sieve_id)/2*tan(radians(self.crown_angle))
 
 
+    @cached_make
     def make(self):
         s = cq.Workplane("XZ").sketch().polygon([
             [0,self.sieve_thickess],
@@ -269,14 +259,20 @@ class CrownSieve(CrownFloor):
         ]).finalize().revolve(360)
         s = s.faces("<Z[-2]").workplane().cylinder(10,(self.tubing_od+6)/2,centered=[1,1,0])
         s = s.faces(">Z[-2]").circle((self.tubing_od + 0.5)/2).cutThruAll()
-        s = s.edges(AndSelector(
-            StringSyntaxSelector("<Z"),
-            RadiusNthSelector(0)
-        )).chamfer(2)
+        if not quality.preview():
+            s = s.edges(AndSelector(
+                StringSyntaxSelector("<Z"),
+                RadiusNthSelector(0)
+            )).chamfer(2)
 
         #s = s.faces("<Z").workplane().move(self.sieve_id/2-8, 0).circle(2).cutThruAll()
-        s = s.faces("<Z").workplane().polarArray(self.sieve_id/2-6, 0, 360, 2*self.n_hole_per_row).circle(self.sieve_hole_r).cutThruAll()
-        s = s.faces("<Z").workplane().polarArray(self.sieve_id/2-11, 0.25*360/self.n_hole_per_row, 360, self.n_hole_per_row).circle(self.sieve_hole_r).cutThruAll()
+        #Both rings of holes are cut at once, through the bottom face (normal pointing down)
+        bottom = cq.Plane(origin=(0,0,0), xDir=(1,0,0), normal=(0,0,-1))
+        holes = (
+            polar_points(self.sieve_id/2-6, 2*self.n_hole_per_row)
+            + polar_points(self.sieve_id/2-11, self.n_hole_per_row, start_angle=0.25*360/self.n_hole_per_row)
+        )
+        s = perforate(s, hole(self.sieve_hole_r, 2*self.tower_od, centered=True), flat_locations(holes, bottom))
         #s = s.faces("<Z").workplane().polarArray(self.sieve_id/2-16, 50, 360, 5).circle(2).cutThruAll()
 
         return s
@@ -286,10 +282,21 @@ class CrownSieve(CrownFloor):
 class LidFloor(Floor):
     floor_h: float = 10
     lip_h: float = 8
+    lid_thick = 2
+
+    def base_profile(self):
+        return super().base_profile() + [
+            [(0, self.floor_h-self.lid_thick), (self.tower_od/2, self.floor_h-self.lid_thick), (self.tower_od/2, self.floor_h), (0, self.floor_h)],
+            [(self.tower_od/2-self.lid_thick, 0), (self.tower_od/2, 0), (self.tower_od/2, self.floor_h), (self.tower_od/2-self.lid_thick, self.floor_h)],
+        ]
+
+    @cached_make
     def make(self):
+        if self.revolve_base:
+            return self.make_base(add_lock_cutout=0, add_lock_nubs=0)
         #lid = cq.Workplane().cylinder(self.lid_h, self.tower_od/2)
         lid = cq.Workplane("XY").cylinder(self.floor_h, self.tower_od/2, centered=[1,1,0])
-        lid = lid.faces("<Z").shell(-2)
+        lid = lid.faces("<Z").shell(-self.lid_thick)
         lid = lid.union(self.make_base(add_lock_cutout=0, add_lock_nubs=0))
         return lid
         
@@ -301,30 +308,50 @@ class MasonFloor(Floor):
     thread_pitch: float = 6.5
     cable_w: float = 6.5
     cable_h: float = 4
+    thread_construction: str = "sweep" #See MasonThread.thread_construction
 
+    def calc_vars(self):
+        super().calc_vars()
+        #Set here rather than in make() so it's there when make() is skipped by the part cache
+        self.lip_h = self.lid_loft_h+self.mason_thread().lid_h
+
+    def mason_thread(self):
+        return MasonThread(lid_h=18, thread_construction=self.thread_construction)
+
+    def base_profile(self):
+        #Cone joining the tower to the lid thread
+        mason_thread = self.mason_thread()
+        return super().base_profile() + [[
+            (self.tower_id/2, 0), (self.tower_od/2, 0),
+            (mason_thread.thread_r+mason_thread.wall_thick, -self.lid_loft_h), (mason_thread.thread_r, -self.lid_loft_h),
+        ]]
+
+    @cached_make
     def make(self):
-        mason_thread = MasonThread(lid_h=18)
-        self.lip_h = self.lid_loft_h+mason_thread.lid_h
-
-        top_sketch = cq.Sketch().circle(self.tower_od).circle(self.tower_id, mode="s")
-        bot_sketch = cq.Sketch().circle(mason_thread.thread_r).circle(82, mode="s")
-        #Make Cone Loft Outer Contour
-        m = (
-            cq.Workplane("XY")
-            .circle(self.tower_od/2)
-            .workplane(-self.lid_loft_h)
-            .circle(mason_thread.thread_r+mason_thread.wall_thick)
-            .loft(ruled=1)
-        )
-        #Bore Cone
-        m = m.cut(
-            cq.Workplane("XY")
-            .circle(self.tower_id/2)
-            .workplane(-self.lid_loft_h)
-            .circle(mason_thread.thread_r)
-            .loft(ruled=1)
-        )
-        m = m.union(self.make_base(add_lock_cutout=0))
+        mason_thread = self.mason_thread()
+
+        if self.revolve_base:
+            m = self.make_base(add_lock_cutout=0)
+        else:
+            top_sketch = cq.Sketch().circle(self.tower_od).circle(self.tower_id, mode="s")
+            bot_sketch = cq.Sketch().circle(mason_thread.thread_r).circle(82, mode="s")
+            #Make Cone Loft Outer Contour
+            m = (
+                cq.Workplane("XY")
+                .circle(self.tower_od/2)
+                .workplane(-self.lid_loft_h)
+                .circle(mason_thread.thread_r+mason_thread.wall_thick)
+                .loft(ruled=1)
+            )
+            #Bore Cone
+            m = m.cut(
+                cq.Workplane("XY")
+                .circle(self.tower_id/2)
+                .workplane(-self.lid_loft_h)
+                .circle(mason_thread.thread_r)
+                .loft(ruled=1)
+            )
+            m = m.union(self.make_base(add_lock_cutout=0))
         m = m.union(mason_thread.make().translate((0,0,-self.lid_loft_h-mason_thread.lid_h)))
         
         cable_hole_h = self.joint_h + self.cable_h
@@ -0,0 +1,321 @@
+import argparse
+import json
+import math
+import sys
+
+import cadquery as cq
+import numpy as np
+
+import siphon_explorer
+from hydraulics import ML, orifice_flow, slot_flow
+from perforation import polar_points
+from sprinkler import Sprinkler
+from tower import Tower, AssembleFloor, base_floor
+from tower_floor import PlantFloor, CrownFloor, CrownSieve, MasonFloor, LidFloor
+
+#Whole tower hydraulic simulator
+#Pump water fills the Sprinkler, drips through the sieves and falls down the tower, where each PlantFloor
+#port catches whatever lands on the wall cutouts of its BellSiphon basin; siphon discharge and anything
+#not caught falls on to the floors below. Catchments and volume curves come from the part parameters
+#(no solids are built) and the time stepping is vectorized over every reservoir and basin in the tower
+#  python tower_flow.py --plant-floors 20 --inflow 30 --pump-on 60 --pump-off 240
+#  report = FlowModel(Tower().floors()).simulate(inflow=20, pump_on=30, pump_off=90)
+
+CD = 0.6
+SPREAD = 3 #Scatter (mm, standard deviation) of falling water around the opening it left
+N_SCATTER = 32 #Samples per falling stream
+N_TABLE = 64 #Points in each level/volume table
+
+def plant_tower(n_plant_floors):
+    #Default tower stack with n plant floors (mini sieves between them), bottom to top
+    cf = CrownFloor.from_instance(base_floor)
+    floors = [AssembleFloor(MasonFloor.from_instance(base_floor))]
+    for i in range(n_plant_floors):
+        if i > 0:
+            mini_sieve = cf.sieve(mini_sieve=True)
+            floors.append(AssembleFloor(mini_sieve, z_offset=3-mini_sieve.sieve_h))
+        floors.append(AssembleFloor(PlantFloor.from_instance(base_floor), z_rot=180 if i % 2 == 0 else 0))
+    floors += [
+        AssembleFloor(cf.sieve()),
+        AssembleFloor(Sprinkler(), z_offset=15),
+        AssembleFloor(cf, z_rot=180),
+        AssembleFloor(LidFloor.from_instance(base_floor)),
+    ]
+    return floors
+
+def world_xy(loc, points):
+    return np.array([(loc * cq.Location(cq.Vector(*p))).toTuple()[0][:2] for p in points])
+
+def rotate_xy(points, angle):
+    (c, s) = (math.cos(math.radians(angle)), math.sin(math.radians(angle)))
+    return points @ np.array([[c, s], [-s, c]])
+
+def convex_hull(points):
+    #Counter clockwise hull (monotone chain)
+    points = sorted(map(tuple, points))
+    def turn(o, a, b):
+        return (a[0]-o[0])*(b[1]-o[1]) - (a[1]-o[1])*(b[0]-o[0])
+    def half(pts):
+        hull = []
+        for p in pts:
+            while len(hull) >= 2 and turn(hull[-2], hull[-1], p) <= 0:
+                hull.pop()
+            hull.append(p)
+        return hull[:-1]
+    return np.array(half(points) + half(points[::-1]))
+
+def inside(hull, points):
+    edges = np.roll(hull, -1, axis=0) - hull
+    rel = points[:, None, :] - hull[None, :, :]
+    return np.all(edges[None, :, 0]*rel[:, :, 1] - edges[None, :, 1]*rel[:, :, 0] >= 0, axis=1)
+
+def scatter(points, spread, weights=None):
+    #Samples (x, y, weight) of water falling from points, weights summing to 1
+    offsets = np.random.default_rng(0).normal(0, spread, (N_SCATTER, 2)) if spread > 0 else np.zeros((1, 2))
+    weights = np.full(len(points), 1/len(points)) if weights is None else np.asarray(weights) / np.sum(weights)
+    xy = (np.asarray(points)[:, None, :] + offsets[None]).reshape(-1, 2)
+    return (xy, np.repeat(weights / len(offsets), len(offsets)))
+
+def revolved_table(radius, h):
+    #Volume (mL) of a revolved reservoir at each level, radius(z) being its inner radius
+    z = np.linspace(0, h, N_TABLE)
+    area = np.pi * radius(z)**2
+    return (z, np.concatenate([[0], np.cumsum((area[1:] + area[:-1]) / 2 * np.diff(z))]) / ML)
+
+class FlowModel:
+    def __init__(self, floors, spread=SPREAD, cd=CD):
+        self.cd = cd
+        self.spread = spread
+        self.nodes = [] #{"name", "kind", "floor", "port"} for every sprinkler, sieve and basin
+        self.tables = [] #(levels, volumes) per node
+        self.openings = [] #(node, bottom z, slot h, width) for sprinkler slots and sieve holes
+        self.emissions = [] #(node, "out"|"over", floor index, (xy, weights)) of falling water
+        self.zones = {} #floor index -> [(basin node, catchment hull)]
+        self.catchers = {} #floor index -> node catching everything that reaches it (sieves), or None (sump)
+        self.basins = [] #(node, siphon levels and areas)
+        self.tower_r = next(f.floor.tower_id/2 for f in floors if hasattr(f.floor, "tower_id"))
+        for (i, f) in enumerate(floors):
+            part = f.floor
+            if isinstance(part, Sprinkler):
+                self.add_sprinkler(i, part, f.z_rot)
+            elif isinstance(part, CrownSieve):
+                self.add_sieve(i, part, f.z_rot)
+            elif isinstance(part, PlantFloor):
+                self.add_plant_floor(i, part, f.z_rot)
+            elif isinstance(part, MasonFloor):
+                self.catchers[i] = None
+        sources = [n for (n, node) in enumerate(self.nodes) if node["kind"] == "sprinkler"]
+        if not sources:
+            raise ValueError("tower has no Sprinkler for the pump to feed")
+        self.source = sources[-1]
+        self.route()
+
+    def add_node(self, name, kind, floor, table, port=None):
+        self.nodes.append({"name": name, "kind": kind, "floor": floor, "port": port})
+        self.tables.append(table)
+        return len(self.nodes) - 1
+
+    def add_sprinkler(self, i, s, z_rot):
+        def radius(z):
+            return s.sprinkler_bot_r - s.wall_thick + (s.sprinkler_top_r - s.sprinkler_bot_r)*z/s.sprinkler_h
+        node = self.add_node(f"{i}:Sprinkler", "sprinkler", i, revolved_table(radius, s.sprinkler_h))
+        slot_angle = (360 - s.slot_spacer_angle*s.n_slots) / s.n_slots
+        row_offset = s.sprinkler_h / (s.n_rows + 1)
+        jets = []
+        for r in range(s.n_rows):
+            z = (r+1)*row_offset
+            start = r*((slot_angle+s.slot_spacer_angle)/2)
+            for k in range(s.n_slots):
+                self.openings.append((node, z - s.slot_h/2, s.slot_h, radius(z)*math.radians(slot_angle)))
+                #Each jet hits the tower wall across the width of its slot
+                jets += polar_points(self.tower_r-1, 5, start + k*(slot_angle+s.slot_spacer_angle) + z_rot, slot_angle)
+        self.emissions.append((node, "out", i, scatter(jets, self.spread)))
+        self.emissions.append((node, "over", i, scatter(jets, self.spread)))
+
+    def add_sieve(self, i, s, z_rot):
+        def radius(z):
+            bottom_r = s.sieve_id/2 - s.sieve_thickess*1.5
+            return bottom_r + (s.sieve_od/2 - s.sieve_thickess - bottom_r)*z/s.sieve_h
+        node = self.add_node(f"{i}:{'Mini' if s.mini_sieve else ''}CrownSieve", "sieve", i, revolved_table(radius, s.sieve_h))
+        #Same rings as CrownSieve.make; they are cut through the bottom face, whose local Y points down -Y
+        holes = (
+            polar_points(s.sieve_id/2-6, 2*s.n_hole_per_row)
+            + polar_points(s.sieve_id/2-11, s.n_hole_per_row, start_angle=0.25*360/s.n_hole_per_row)
+        )
+        side = math.sqrt(math.pi)*s.sieve_hole_r #Square of the same area
+        for _ in holes:
+            self.openings.append((node, 0, side, side))
+        holes = rotate_xy(np.array(holes) * (1, -1), z_rot)
+        self.emissions.append((node, "out", i, scatter(holes, self.spread)))
+        rim = polar_points(s.sieve_od/2, 72)
+        self.emissions.append((node, "over", i, scatter(rim, self.spread)))
+        self.catchers[i] = node
+
+    def add_plant_floor(self, i, pf, z_rot):
+        b = pf.netcup
+        d = siphon_explorer.derived(siphon_explorer.design_grid(siphon_explorer.part_fields(b), {}))
+        (outlet, stop, trigger) = (float(v[0]) for v in siphon_explorer.levels(d))
+        #Water spills out of the lowest wall cutout once the basin is past it
+        spill = float(siphon_explorer.installed_z(d, -b.basin_r*math.cos(math.radians(b.cutout_angle_range/2)), b.cutout_z_offset)[0])
+        bottom = float(siphon_explorer.installed_z(d, b.basin_r, 0)[0])
+        levels = np.linspace(min(bottom, outlet), spill, N_TABLE)
+        volumes = siphon_explorer.volume_below(d, levels[None])[0] / ML
+        siphon = {
+            "outlet": outlet, "stop": stop, "trigger": trigger,
+            "bore_area": math.pi*(b.siphon_r - b.wall_thick)**2,
+            "drain_area": math.pi*b.drain_hole_r**2 if b.drain_hole else 0,
+        }
+        #Cutout window on the upper side of the basin (around +X in the basin's frame), as seen from above
+        half = b.cutout_angle_range/2 + math.degrees(b.cutout_r/b.basin_r)
+        window = [
+            (b.basin_r*math.cos(math.radians(a)), b.basin_r*math.sin(math.radians(a)), z)
+            for a in np.linspace(-half, half, 9) for z in (b.cutout_z_offset, b.cutout_z_offset+b.cutout_h)
+        ]
+        floor_rot = cq.Location(cq.Vector(0,0,0), cq.Vector(0,0,1), z_rot)
+        self.zones[i] = []
+        for p in range(pf.n_ports):
+            loc = floor_rot * pf.netcup_location(p * 360/pf.n_ports)
+            node = self.add_node(f"{i}:PlantFloor[{p}]", "basin", i, (levels, volumes), port=p)
+            self.basins.append((node, siphon))
+            self.zones[i].append((node, convex_hull(world_xy(loc, window))))
+            drain = world_xy(loc, [(-b.siphon_offset, 0, 0)])
+            self.emissions.append((node, "out", i, scatter(drain, self.spread)))
+            self.emissions.append((node, "over", i, scatter(drain, self.spread)))
+
+    def route(self):
+        #Fractions of each node's outflow (and overflow) reaching every other node, or the sump
+        n = len(self.nodes)
+        self.routes = {"out": np.zeros((n, n)), "over": np.zeros((n, n))}
+        self.to_sump = {"out": np.zeros(n), "over": np.zeros(n)}
+        for (node, kind, floor, (xy, w)) in self.emissions:
+            falling = np.ones(len(w), dtype=bool)
+            for j in range(floor-1, -1, -1):
+                for (basin, hull) in self.zones.get(j, []):
+                    caught = falling & inside(hull, xy)
+                    self.routes[kind][basin, node] += w[caught].sum()
+                    falling &= ~caught
+                if j in self.catchers:
+                    if self.catchers[j] is not None:
+                        self.routes[kind][self.catchers[j], node] += w[falling].sum()
+                        falling[:] = False
+                    break
+            self.to_sump[kind][node] += w[falling].sum()
+
+    def simulate(self, inflow, pump_on, pump_off=0, cycles=1, dt=0.01, dry_ml=0.5):
+        #Steps the whole tower through cycles of the pump running pump_on s at inflow (mL/s) then resting pump_off s
+        n = len(self.nodes)
+        levels = np.array([t[0] for t in self.tables])
+        tables = np.array([t[1] for t in self.tables]) + np.arange(N_TABLE)*1e-9 #Strictly increasing for lookups
+        capacity = tables[:, -1]
+        (o_node, o_bottom, o_slot_h, o_width) = (np.array(c) for c in zip(*self.openings))
+        b_node = np.array([b for (b, _) in self.basins], dtype=int)
+        siphon = {k: np.array([s[k] for (_, s) in self.basins]) for k in self.basins[0][1]} if self.basins else {}
+        rows = np.arange(n)
+
+        volume = np.zeros(n)
+        overflow = np.zeros(n)
+        latched = np.zeros(len(b_node), dtype=bool)
+        received = np.zeros(n)
+        spilled = np.zeros(n)
+        siphon_cycles = np.zeros(len(b_node), dtype=int)
+        wetted = np.zeros(len(b_node), dtype=bool)
+        dry_spell = np.zeros(len(b_node))
+        longest_dry = np.zeros(len(b_node))
+        sump = 0.0
+        period = pump_on + pump_off
+        steps = int(round(cycles * period / dt))
+        for step in range(steps):
+            pump = inflow if (step*dt) % period < pump_on else 0
+            #Level of every node from its volume table
+            k = np.clip((tables < volume[:, None]).sum(axis=1), 1, N_TABLE-1)
+            (v0, v1) = (tables[rows, k-1], tables[rows, k])
+            (h0, h1) = (levels[rows, k-1], levels[rows, k])
+            level = h0 + (h1 - h0) * np.clip((volume - v0) / (v1 - v0), 0, 1)
+
+            out = np.bincount(o_node, slot_flow(level[o_node] - o_bottom, o_slot_h, o_width, self.cd), minlength=n) / ML
+            if len(b_node):
+                h = level[b_node]
+                started = (h >= siphon["trigger"]) & ~latched
+                latched = (latched | started) & (h > siphon["stop"])
+                siphon_cycles += started
+                head = h - siphon["outlet"]
+                out[b_node] = (orifice_flow(siphon["drain_area"], head, self.cd) + np.where(latched, orifice_flow(siphon["bore_area"], head, self.cd), 0)) / ML
+            out = np.minimum(out, volume/dt)
+
+            inflow_now = self.routes["out"] @ out + self.routes["over"] @ overflow
+            inflow_now[self.source] += pump
+            received += inflow_now*dt
+            sump += (self.to_sump["out"] @ out + self.to_sump["over"] @ overflow)*dt
+            volume += (inflow_now - out)*dt
+            overflow = np.clip(volume - capacity, 0, None) / dt
+            volume -= overflow*dt
+            spilled += overflow*dt
+
+            if len(b_node):
+                dry = volume[b_node] < dry_ml
+                wetted |= ~dry
+                dry_spell = np.where(dry & wetted, dry_spell + dt, 0)
+                longest_dry = np.maximum(longest_dry, dry_spell)
+        return self.report(inflow*pump_on*cycles, received, spilled, sump, b_node, siphon_cycles, wetted, longest_dry)
+
+    def report(self, pumped, received, spilled, sump, b_node, siphon_cycles, wetted, longest_dry):
+        ports = []
+        for (j, node) in enumerate(b_node):
+            info = self.nodes[node]
+            ports.append({
+                "floor": info["floor"], "port": info["port"],
+                "received_ml": float(received[node]),
+                "share": float(received[node] / pumped) if pumped else 0.0,
+                "siphon_cycles": int(siphon_cycles[j]),
+                "longest_dry_s": float(longest_dry[j]),
+                "never_wet": bool(not wetted[j]),
+            })
+        floors = {}
+        for p in ports:
+            floor = floors.setdefault(p["floor"], {"floor": p["floor"], "received_ml": 0.0, "share": 0.0, "ports": 0})
+            floor["received_ml"] += p["received_ml"]
+            floor["share"] += p["share"]
+            floor["ports"] += 1
+        return {
+            "pumped_ml": pumped,
+            "sump_ml": float(sump),
+            "ports": ports,
+            "floors": sorted(floors.values(), key=lambda f: -f["floor"]),
+            "spilled_ml": {self.nodes[n]["name"]: float(v) for (n, v) in enumerate(spilled) if v > 0},
+        }
+
+def runs_dry(report, max_dry_s):
+    return [p for p in report["ports"] if p["never_wet"] or p["longest_dry_s"] > max_dry_s]
+
+def print_report(report, max_dry_s):
+    print(f"{'floor':>6}{'port':>6}{'received mL':>14}{'share':>8}{'siphons':>9}{'longest dry s':>15}")
+    for p in sorted(report["ports"], key=lambda p: (-p["floor"], p["port"])):
+        dry = " never wet" if p["never_wet"] else (" runs dry" if p["longest_dry_s"] > max_dry_s else "")
+        print(f"{p['floor']:>6}{p['port']:>6}{p['received_ml']:>14.1f}{p['share']:>8.1%}{p['siphon_cycles']:>9}{p['longest_dry_s']:>15.1f}{dry}")
+    print(f"pumped {report['pumped_ml']:.0f} mL, {report['sump_ml']:.0f} mL back in the sump")
+    for (name, ml) in report["spilled_ml"].items():
+        print(f"{name} overflowed {ml:.1f} mL")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate water flow through a cq_hydro tower")
+    parser.add_argument("--plant-floors", type=int, help="Plant floors in a generated tower (default: the Tower part's floors)")
+    parser.add_argument("--inflow", type=float, default=20, help="Pump flow, mL/s")
+    parser.add_argument("--pump-on", type=float, default=60, help="Pump run time per cycle, s")
+    parser.add_argument("--pump-off", type=float, default=120, help="Pump rest time per cycle, s")
+    parser.add_argument("--cycles", type=int, default=1)
+    parser.add_argument("--dt", type=float, default=0.01, help="Time step, s")
+    parser.add_argument("--spread", type=float, default=SPREAD, help="Scatter of falling water, mm")
+    parser.add_argument("--max-dry", type=float, default=60, help="Longest a basin may sit empty before the port counts as dry, s")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args(argv)
+
+    floors = Tower().floors() if args.plant_floors is None else plant_tower(args.plant_floors)
+    report = FlowModel(floors, spread=args.spread).simulate(args.inflow, args.pump_on, args.pump_off, args.cycles, args.dt)
+    print_report(report, args.max_dry)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=1)
+    return 1 if runs_dry(report, args.max_dry) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
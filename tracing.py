@@ -0,0 +1,121 @@
+import cadquery as cq
+import inspect
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from functools import wraps
+
+#Opt-in tracing of the CadQuery operations run while a part builds
+#Every Workplane method and the Shape level booleans are timed along with the line in this repo that
+#called them and the face counts going in and out. Nested operations (eg. the cut inside cutThruAll)
+#become nested frames, so the .folded output can be fed straight to flamegraph.pl or speedscope
+#  with Tracer("BellSiphon") as t:
+#      BellSiphon().part()
+#  t.save("stl/bell_siphon")
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SHAPE_OPS = ["fuse", "cut", "intersect", "split", "fillet", "chamfer", "clean", "mesh"]
+#Shared geometry helpers; operations they run are attributed to the part code that called them
+HELPERS = ["tracing.py", "part_cache.py", "booleans.py", "patterns.py", "perforation.py", "primitives.py"]
+
+def _workplane_ops():
+    return [name for (name, f) in vars(cq.Workplane).items() if not name.startswith("_") and inspect.isfunction(f)]
+
+def n_faces(obj):
+    if isinstance(obj, cq.Workplane):
+        #objects rather than vals() so counting never goes through a traced method
+        return sum(n_faces(v) for v in obj.objects)
+    if isinstance(obj, cq.Shape):
+        return len(obj.Faces())
+    return 0
+
+def caller():
+    #Innermost frame in one of this repo's part modules, as "Class.method (file:line)"
+    frame = sys._getframe(2)
+    while frame is not None:
+        path = os.path.abspath(frame.f_code.co_filename)
+        if os.path.dirname(path) == REPO_DIR and os.path.basename(path) not in HELPERS:
+            name = getattr(frame.f_code, "co_qualname", frame.f_code.co_name)
+            return f"{name} ({os.path.basename(path)}:{frame.f_lineno})"
+        frame = frame.f_back
+    return "?"
+
+class Tracer:
+    active = None
+
+    def __init__(self, name):
+        self.name = name
+        self.events = []
+        self._stack = []
+        self._originals = []
+
+    def _wrap(self, cls, op):
+        original = vars(cls)[op]
+        tracer = self
+        @wraps(original)
+        def traced(obj, *args, **kwargs):
+            source = caller()
+            event = {
+                "op": f"{cls.__name__}.{op}", "source": source, "frame": f"{cls.__name__}.{op} @ {source}",
+                "depth": len(tracer._stack), "faces_in": n_faces(obj), "children_s": 0,
+            }
+            tracer._stack.append(event)
+            t_start = time.perf_counter()
+            try:
+                result = original(obj, *args, **kwargs)
+            finally:
+                event["duration_s"] = time.perf_counter() - t_start
+                tracer._stack.pop()
+                event["stack"] = [e["frame"] for e in tracer._stack]
+                if tracer._stack:
+                    tracer._stack[-1]["children_s"] += event["duration_s"]
+                tracer.events.append(event)
+            event["faces_out"] = n_faces(result)
+            return result
+        self._originals.append((cls, op, original))
+        setattr(cls, op, traced)
+
+    def __enter__(self):
+        if Tracer.active is not None:
+            raise RuntimeError(f"already tracing {Tracer.active.name}")
+        Tracer.active = self
+        for op in _workplane_ops():
+            self._wrap(cq.Workplane, op)
+        for cls in (cq.Shape, cq.Solid, cq.Compound):
+            for op in SHAPE_OPS:
+                if op in vars(cls):
+                    self._wrap(cls, op)
+        return self
+
+    def __exit__(self, *exc):
+        for (cls, op, original) in reversed(self._originals):
+            setattr(cls, op, original)
+        self._originals = []
+        Tracer.active = None
+
+    def folded(self):
+        #Collapsed stacks ("part;frame;frame self_microseconds"), one line per unique stack
+        totals = defaultdict(float)
+        for e in self.events:
+            stack = ";".join([self.name] + e["stack"] + [e["frame"]])
+            totals[stack] += max(e["duration_s"] - e["children_s"], 0)
+        return "".join(f"{stack} {round(s*1e6)}\n" for (stack, s) in sorted(totals.items()) if round(s*1e6) > 0)
+
+    def summary(self):
+        #Self time per (operation, source line), slowest first
+        rows = defaultdict(lambda: {"calls": 0, "self_s": 0.0})
+        for e in self.events:
+            row = rows[e["frame"]]
+            row["calls"] += 1
+            row["self_s"] += max(e["duration_s"] - e["children_s"], 0)
+        return sorted(({"frame": k, **v} for (k, v) in rows.items()), key=lambda r: -r["self_s"])
+
+    def save(self, path_prefix):
+        #Writes <prefix>.folded (flame graph input) and <prefix>.trace.json (every operation)
+        with open(f"{path_prefix}.folded", "w") as f:
+            f.write(self.folded())
+        with open(f"{path_prefix}.trace.json", "w") as f:
+            json.dump({"part": self.name, "summary": self.summary(), "events": self.events}, f, indent=1)
+        return self
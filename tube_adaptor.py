@@ -5,6 +5,9 @@ from math import tan, radians
 import sys
 sys.path.append("../cq_style")
 from cq_style import StylishPart
+from part_cache import cached_make
+from booleans import fuse_all
+import primitives
 
 @dataclass
 class TubeAdaptor(StylishPart):
@@ -25,22 +28,15 @@ class TubeAdaptor(StylishPart):
         self.wall_thick = self.wall_thick if self.wall_thick > 0 else self.fdm_extrude_w * 3
         self.adaptor_ir = self.adaptor_or - self.wall_thick
         self.barb_r = self.adaptor_or + self.fdm_extrude_w * 2
+    @cached_make
     def make(self):
         part = (
             Workplane("XY").cylinder(self.adaptor_h, self.adaptor_or, centered=[1,1,0])
             .faces("|Z").shell(-self.wall_thick)
         )
         barb_h = (self.barb_r-self.adaptor_or)/tan(radians(self.barb_angle))
-        barb_sketch = (
-            Sketch()
-            .segment((self.adaptor_or,0), (self.adaptor_or,barb_h))
-            .segment((self.adaptor_or,barb_h), (self.barb_r, barb_h))
-            .close()
-            .assemble()
-        )
-        barb = Workplane("XZ").placeSketch(barb_sketch).revolve(360)
-        for i in range(self.n_barbs):
-            part = part.union(barb.translate((0,0,i*(barb_h+self.barb_spacing))))
+        barb = primitives.barb(self.adaptor_or, self.barb_r, barb_h)
+        part = fuse_all(part, [barb.translate((0,0,i*(barb_h+self.barb_spacing))) for i in range(self.n_barbs)])
 
         if self.flip_part:
             part = (